@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the memory used to resolve and queue a large playlist.
+
+Every playlist size is resolved in a fresh process, once the way
+`Spotdl.search` does it (every page read, then every song built) and once
+streamed through `TrackScheduler.submit_stream`. The Spotify API is served
+from memory with items shaped like real ones, so only resolution is
+measured; `Spotdl.search` also fetches the full metadata of every song up
+front, so the eager numbers are a lower bound. Streamed tracks go through
+what `download_track` does besides downloading: their metadata is completed
+with the track, artist and album requests of `Pipeline.complete_metadata`,
+through spotdl's (bounded) response cache, and their stream is taken and
+released.
+
+Streaming is not free: a job keeps the status record of every track for
+`/jobs/{job_id}`, so its memory still grows by a fixed amount per track.
+That floor is printed below the table, as the growth per track between the
+smallest and the largest size.
+
+    python bench_resolver_memory.py [sizes...]
+"""
+
+import resource
+import subprocess
+import sys
+
+from spotdl.types import playlist
+from spotdl.types import song as spotdl_song
+from spotdl.utils.spotify import SpotifyClient
+from spotipy import Spotify
+
+from downtify import resolver
+from downtify.pipeline import Pipeline
+from downtify.scheduler import TrackScheduler
+from downtify.streaming import release_stream, stream_for
+
+PLAYLIST = 'https://open.spotify.com/playlist/37i9dQZF1DXcBWIGoYBM5M'
+SIZES = [1000, 5000, 10000, 20000]
+# A real item lists the ~180 markets a track is available in
+MARKETS = [f'{a}{b}' for a in 'ABCDEFGHIJKLMN' for b in 'ABCDEFGHIJKLM']
+
+
+def make_album(index: int) -> dict:
+    return {
+        'id': f'album{index}',
+        'name': f'Album {index}',
+        'album_type': 'album',
+        'release_date': '2020-01-01',
+        'total_tracks': 12,
+        'available_markets': list(MARKETS),
+        'images': [
+            {
+                'url': f'https://i.scdn.co/image/{index}-{size}',
+                'width': size,
+                'height': size,
+            }
+            for size in (640, 300, 64)
+        ],
+        'artists': [{'name': f'Artist {index}', 'id': f'artist{index}'}],
+    }
+
+
+def make_track(index: int) -> dict:
+    return {
+        'id': f'track{index}',
+        'name': f'Song {index}',
+        'type': 'track',
+        'is_local': False,
+        'duration_ms': 180000,
+        'explicit': False,
+        'popularity': 50,
+        'disc_number': 1,
+        'track_number': index % 12 + 1,
+        'available_markets': list(MARKETS),
+        'external_urls': {
+            'spotify': f'https://open.spotify.com/track/track{index}'
+        },
+        'external_ids': {'isrc': f'USRC1{index:07d}'},
+        'artists': [{'name': f'Artist {index}', 'id': f'artist{index}'}],
+        'album': make_album(index),
+    }
+
+
+def make_item(index: int) -> dict:
+    return {'added_at': '2024-01-01T00:00:00Z', 'track': make_track(index)}
+
+
+def make_full_album(index: int) -> dict:
+    """An album response lists every track of the album"""
+    tracks = [make_track(index) for _ in range(12)]
+    for track in tracks:
+        del track['album']
+    return {
+        **make_album(index),
+        'copyrights': [{'text': '2020 Label', 'type': 'C'}],
+        'genres': [],
+        'label': 'Label',
+        'popularity': 50,
+        'tracks': {'items': tracks, 'total': 12, 'next': None},
+    }
+
+
+def make_artist(index: int) -> dict:
+    return {
+        'id': f'artist{index}',
+        'name': f'Artist {index}',
+        'genres': ['pop', 'dance pop'],
+        'popularity': 50,
+        'followers': {'total': 1000},
+        'images': make_album(index)['images'],
+    }
+
+
+class FakeSpotify:
+    """
+    The parts of the Spotify client used to read a playlist and complete
+    the metadata of its songs, with spotdl's caching `_get`
+    """
+
+    page_size = 100
+    no_cache = False
+    max_retries = 3
+    _get = SpotifyClient._get
+    track = Spotify.track
+    artist = Spotify.artist
+    album = Spotify.album
+
+    def __init__(self, total: int):
+        self.total = total
+
+    @staticmethod
+    def _get_id(kind, url):
+        return url.rsplit('/', 1)[-1]
+
+    @staticmethod
+    def playlist(url, fields=None):
+        return {
+            'name': 'Benchmark',
+            'description': '',
+            'external_urls': {'spotify': url},
+            'owner': {'display_name': 'downtify'},
+            'images': [],
+        }
+
+    def page(self, offset: int) -> dict:
+        end = min(offset + self.page_size, self.total)
+        return {
+            'items': [make_item(i) for i in range(offset, end)],
+            'total': self.total,
+            'next': str(end) if end < self.total else None,
+        }
+
+    def playlist_items(self, url):
+        return self.page(0)
+
+    def next(self, response):
+        return self.page(int(response['next']))
+
+    @property
+    def cache(self):
+        return SpotifyClient.cache
+
+    def _internal_call(self, method, url, payload, params):
+        kind, _, name = url.partition('/')
+        if kind == 'tracks':
+            return make_track(int(name.removeprefix('track')))
+        if kind == 'artists':
+            return make_artist(int(name.removeprefix('artist')))
+        if kind == 'albums':
+            return make_full_album(int(name.removeprefix('album')))
+        return self.page(0 if kind == 'playlists' else int(url))
+
+
+def eager(total: int) -> int:
+    """Resolve the whole playlist first, like `Spotdl.search`"""
+    playlist.SpotifyClient = lambda: FakeSpotify(total)
+    _, songs = playlist.Playlist.get_metadata(PLAYLIST)
+    return len(songs)
+
+
+def process(track) -> str:
+    """Complete a track's metadata and hold its stream, as when downloaded"""
+    stream_for(track)
+    try:
+        song = Pipeline.complete_metadata(track.song)
+        return f'/tmp/{song.song_id}.mp3'
+    finally:
+        release_stream(track)
+
+
+def streamed(total: int) -> int:
+    """Resolve the playlist while its tracks are being processed"""
+    client = FakeSpotify(total)
+    resolver.bound_spotify_cache()
+    spotdl_song.SpotifyClient = lambda: client
+    scheduler = TrackScheduler(process, 4)
+    songs = resolver.iter_playlist(PLAYLIST, client)
+    job = scheduler.submit_stream('bench', songs, window=100)
+    job.wait()
+    return len(job.tracks)
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process, in KiB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(mode: str, total: int):
+    """Run one mode in this process and print baseline and peak RSS"""
+    baseline = peak_rss()
+    count = {'eager': eager, 'streamed': streamed}[mode](total)
+    print(baseline, peak_rss(), count)
+
+
+def main():
+    """Run every size and mode in its own process"""
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    print('🧮 Resolver memory benchmark (peak RSS above baseline)')
+    print('=' * 60)
+    print(f'{"tracks":>8} {"eager":>12} {"streamed":>12} {"songs":>8}')
+    rows = []
+    for total in sizes:
+        row = []
+        for mode in ('eager', 'streamed'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--measure', mode, str(total)],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            baseline, peak, count = map(int, output.split())
+            row.append(peak - baseline)
+        rows.append((total, *row))
+        eager_mb, streamed_mb = (kib / 1024 for kib in row)
+        print(
+            f'{total:>8} {eager_mb:>9.1f} MB {streamed_mb:>9.1f} MB {count:>8}'
+        )
+
+    if len(rows) > 1:
+        (first, *small), (last, *large) = rows[0], rows[-1]
+        eager_floor, streamed_floor = (
+            (high - low) * 1024 / (last - first)
+            for low, high in zip(small, large)
+        )
+        print('=' * 60)
+        print(
+            f'Growth per track: {eager_floor:.0f} bytes eager, '
+            f'{streamed_floor:.0f} bytes streamed'
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        measure(sys.argv[2], int(sys.argv[3]))
+    else:
+        sys.exit(main())
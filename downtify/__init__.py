@@ -0,0 +1 @@
+"""Download engine used by the Downtify web application."""
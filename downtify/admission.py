@@ -0,0 +1,104 @@
+"""
+Admission control for download requests.
+
+`/download/` and `/download-web/` hold a threadpool thread until their
+tracks are done, so under load the threadpool, the disk and the network all
+run out together. `AdmissionController` turns requests away with a retry
+estimate once too many are running or too many tracks are waiting.
+"""
+
+import math
+import threading
+from contextlib import contextmanager
+
+from downtify.scheduler import TrackScheduler
+
+
+class Saturated(Exception):
+    """The download system is full, retry after `retry_after` seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admit at most `max_requests` download requests at once, and none while
+    more than `max_queued_tracks` tracks wait for a download slot.
+
+    The retry estimate is the time the scheduler needs to work through its
+    current backlog, from a moving average of how long a track takes.
+    """
+
+    smoothing = 0.1
+    max_retry_after = 600
+
+    def __init__(
+        self,
+        scheduler: TrackScheduler,
+        max_requests: int = 32,
+        max_queued_tracks: int = 1000,
+        track_seconds: float = 30.0,
+    ):
+        self.scheduler = scheduler
+        self.max_requests = max_requests
+        self.max_queued_tracks = max_queued_tracks
+        self.track_seconds = track_seconds
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def track_finished(self, seconds: float):
+        with self._lock:
+            self.track_seconds += self.smoothing * (
+                seconds - self.track_seconds
+            )
+
+    def estimated_wait(self) -> float:
+        """Seconds until the tracks queued and running now are done"""
+        backlog = self.scheduler.queued + self.scheduler.running
+        return (
+            backlog / max(self.scheduler.concurrency, 1) * self.track_seconds
+        )
+
+    def saturation(self) -> str | None:
+        """Why no request is admitted right now, or None"""
+        if self.active >= self.max_requests:
+            return f'{self.active} download requests running'
+        queued = self.scheduler.queued
+        if queued >= self.max_queued_tracks:
+            return f'{queued} tracks queued'
+        return None
+
+    @contextmanager
+    def admit(self):
+        """Hold an admission slot for the block, or raise `Saturated`."""
+        with self._lock:
+            reason = self.saturation()
+            if reason is None:
+                self.active += 1
+            else:
+                self.rejected += 1
+        if reason is not None:
+            wait = math.ceil(self.estimated_wait())
+            raise Saturated(reason, min(max(wait, 1), self.max_retry_after))
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def as_dict(self) -> dict:
+        reason = self.saturation()
+        return {
+            'saturated': reason is not None,
+            'reason': reason,
+            'active_requests': self.active,
+            'max_requests': self.max_requests,
+            'queued_tracks': self.scheduler.queued,
+            'max_queued_tracks': self.max_queued_tracks,
+            'estimated_wait': round(self.estimated_wait(), 1),
+        }
@@ -0,0 +1,234 @@
+"""
+Self-hosted, fingerprinted and precompressed static assets.
+
+`python -m downtify.assets` vendors the CSS and JavaScript the templates
+used to load from CDNs, together with the local files they reference, into
+one directory. Every file gets a content hash in its name and gzip and
+brotli copies next to it, and `manifest.json` maps the names the templates
+use to the hashed files. `PrecompressedFiles` serves that directory with
+the compressed copy the client accepts and `Cache-Control: immutable`, so a
+browser fetches every asset once per version, from the same connection as
+the page.
+
+Without a build the templates keep pointing at the CDNs and `/static`.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import urllib.request
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urljoin
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Name used by the templates: where it comes from when built, and what to
+# link to when it is not
+VENDORED = {
+    'htmx.min.js': 'https://unpkg.com/htmx.org@2.0.4/dist/htmx.min.js',
+    'bootstrap.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/'
+        'bootstrap.min.css'
+    ),
+    'font-awesome.min.css': (
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/'
+        'all.min.css'
+    ),
+}
+LOCAL = {
+    'style.css': 'static/css/style.css',
+    'script.js': 'static/js/script.js',
+    'favicon.ico': 'assets/favicon.ico',
+    'favicon-16x16.png': 'assets/favicon-16x16.png',
+    'favicon-32x32.png': 'assets/favicon-32x32.png',
+    'apple-touch-icon.png': 'assets/apple-touch-icon.png',
+}
+
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Already compressed formats (png, woff2) gain nothing
+COMPRESSIBLE = {'.css', '.js', '.svg', '.ttf', '.ico', '.json'}
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+CSS_URL = re.compile(rb'url\((["\']?)([^)"\']+)\1\)')
+SOURCE_MAP = re.compile(
+    rb'/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S*'
+)
+
+Fetch = Callable[[str], bytes]
+
+
+def fetch(source: str) -> bytes:
+    """Read `source`, a URL or a path relative to the working directory"""
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            return response.read()
+    return Path(source).read_bytes()
+
+
+def compress(path: Path, data: bytes):
+    """Write the gzip and brotli copies of `path` that are smaller"""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            path.with_name(path.name + suffix).write_bytes(compressed)
+
+
+class Builder:
+    """Writes fingerprinted files into `output`, each source only once"""
+
+    def __init__(self, output: Path, fetch: Fetch = fetch):
+        self.output = output
+        self.fetch = fetch
+        self.written: dict[str, str] = {}
+
+    def add(self, name: str, source: str) -> str:
+        """Vendor `source` as `name` and return its hashed file name"""
+        if source in self.written:
+            return self.written[source]
+
+        data = SOURCE_MAP.sub(b'', self.fetch(source))
+        if name.endswith('.css'):
+            data = self.rewrite_urls(data, source)
+
+        stem, ext = os.path.splitext(name)
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        hashed = f'{stem}.{digest}{ext}'
+        path = self.output / hashed
+        path.write_bytes(data)
+        if ext in COMPRESSIBLE:
+            compress(path, data)
+        self.written[source] = hashed
+        return hashed
+
+    def rewrite_urls(self, css: bytes, source: str) -> bytes:
+        """Vendor the fonts and images a stylesheet references"""
+
+        def vendor(match: re.Match) -> bytes:
+            reference = match.group(2).decode()
+            if reference.startswith(('data:', '#')):
+                return match.group(0)
+            url = urljoin(source, reference)
+            base = url.split('?')[0].split('#')[0]
+            hashed = self.add(os.path.basename(base), base)
+            return f'url({hashed})'.encode()
+
+        return CSS_URL.sub(vendor, css)
+
+
+def build(output: Path, fetch: Fetch = fetch) -> dict[str, str]:
+    """Vendor every asset into `output` and write its manifest"""
+    output.mkdir(parents=True, exist_ok=True)
+    builder = Builder(output, fetch)
+    manifest = {
+        name: builder.add(name, source)
+        for name, source in (VENDORED | LOCAL).items()
+    }
+    (output / MANIFEST).write_text(
+        json.dumps(manifest, indent=2), encoding='utf-8'
+    )
+    return manifest
+
+
+class Assets:
+    """The URLs the templates use for assets, built or not"""
+
+    def __init__(self, directory: str, prefix: str = '/dist'):
+        self.prefix = prefix
+        try:
+            with open(
+                os.path.join(directory, MANIFEST), encoding='utf-8'
+            ) as file:
+                self.manifest: dict[str, str] = json.load(file)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def url(self, name: str) -> str:
+        if name in self.manifest:
+            return f'{self.prefix}/{self.manifest[name]}'
+        if name in VENDORED:
+            return VENDORED[name]
+        return f'/{LOCAL[name]}'
+
+
+def accepted_encodings(headers: Headers) -> list[str]:
+    """The encodings of `ENCODINGS` the client accepts, best first"""
+    accepted = set()
+    for item in headers.get('accept-encoding', '').split(','):
+        encoding, _, params = item.strip().partition(';')
+        if params.replace(' ', '') not in {'q=0', 'q=0.0'}:
+            accepted.add(encoding.strip().lower())
+    return [encoding for encoding in ENCODINGS if encoding in accepted]
+
+
+class PrecompressedFiles(StaticFiles):
+    """
+    Static files served from their precompressed copy when the client
+    accepts it. File names carry a content hash, so every file is cached
+    for good; only the manifest is not.
+    """
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        media_type = mimetypes.guess_type(str(full_path))[0]
+        path, headers = full_path, {}
+        for encoding in accepted_encodings(request_headers):
+            compressed = f'{full_path}{ENCODINGS[encoding]}'
+            if os.path.isfile(compressed):
+                path, stat_result = compressed, os.stat(compressed)
+                headers['Content-Encoding'] = encoding
+                break
+
+        response = FileResponse(
+            path,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+            stat_result=stat_result,
+            method=scope['method'],
+        )
+        response.headers['Vary'] = 'Accept-Encoding'
+        if os.path.basename(full_path) != MANIFEST:
+            response.headers['Cache-Control'] = IMMUTABLE
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m downtify.assets',
+        description='Vendor, fingerprint and precompress the static assets.',
+    )
+    parser.add_argument('output', nargs='?', default='dist')
+    args = parser.parse_args(argv)
+
+    manifest = build(Path(args.output))
+    if brotli is None:
+        print('brotli is not installed, only gzip copies were written')
+    for name, hashed in manifest.items():
+        print(f'{name:>24} -> {args.output}/{hashed}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Batched resolution of many URLs into one deduplicated download job.
+
+Every URL is expanded into its tracks concurrently and each track is queued
+as soon as it is resolved, so downloads start while the rest of the batch
+is still being read. Tracks shared between URLs are queued once; their full
+metadata is looked up by the pipeline right before each download.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+from downtify.scheduler import Job, Track, TrackScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def parse_urls(body: bytes, content_type: str = '') -> list[str]:
+    """
+    Read URLs from a JSON list, a `{"urls": [...]}` object or a
+    newline-delimited body. Blank lines and `#` comments are ignored and
+    duplicates are dropped, keeping the first occurrence.
+    """
+    text = body.decode('utf-8').strip()
+    if 'json' in content_type or text.startswith(('[', '{')):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get('urls', [])
+        if not isinstance(data, list):
+            raise ValueError('Expected a list of URLs')
+        urls = [str(url).strip() for url in data]
+    else:
+        urls = [line.strip() for line in text.splitlines()]
+
+    urls = [url for url in urls if url and not url.startswith('#')]
+    return list(dict.fromkeys(urls))
+
+
+def song_key(song) -> str:
+    return song.url or song.download_url or song.display_name
+
+
+class BatchFeeder:
+    """
+    Resolves URLs with `expand(url)`, `threads` at a time, and adds every
+    new song to the open `job` as it comes; see `TrackScheduler.add` for
+    `window`. Each URL is recorded as a source of the job, with its tracks
+    or the error that stopped it.
+    """
+
+    threads = 8
+    window: int | None = None
+
+    def __init__(
+        self,
+        scheduler: TrackScheduler,
+        job: Job,
+        expand: Callable[[str], Iterable],
+    ):
+        self.scheduler = scheduler
+        self.job = job
+        self.expand = expand
+        self.queued: dict[str, Track] = {}
+        self._lock = threading.Lock()
+
+    def feed(self, urls: list[str]) -> int:
+        """Resolve and queue every URL, returning the tracks queued"""
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            list(executor.map(self.feed_url, urls))
+        return len(self.queued)
+
+    def feed_url(self, url: str):
+        tracks: list[Track] = []
+        self.job.add_source(url, tracks, resolving=True)
+        error = None
+        try:
+            self._add(self.expand(url), tracks)
+        except Exception as exception:
+            logger.warning('Could not resolve %s: %s', url, exception)
+            error = str(exception)
+        finally:
+            self.job.resolved(url, error)
+
+    def _add(self, songs: Iterable, tracks: list[Track]):
+        keys = set()
+        for song in songs:
+            key = song_key(song)
+            if key in keys:
+                continue
+            with self._lock:
+                if key not in self.queued:
+                    self.queued[key] = self.scheduler.add(
+                        self.job, [song], self.window
+                    )[0]
+            keys.add(key)
+            tracks.append(self.queued[key])
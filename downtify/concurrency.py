@@ -0,0 +1,151 @@
+"""
+Adaptive download concurrency.
+
+A fixed number of download threads is too low on a fast link and too high
+once YouTube starts throttling. `AIMDController` moves the limit the way TCP
+moves its congestion window: one more concurrent download after every
+healthy round, half as many as soon as downloads fail or slow down.
+"""
+
+import logging
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+
+@dataclass
+class Sample:
+    started_at: float
+    finished_at: float
+    size: int
+    error: bool
+
+    @property
+    def latency(self) -> float | None:
+        """Seconds per MiB, so long and short tracks compare fairly"""
+        if self.error or not self.size:
+            return None
+        return (self.finished_at - self.started_at) / (self.size / MIB)
+
+
+class AIMDController:
+    """
+    Additive increase, multiplicative decrease of the download limit.
+
+    Finished fetches are grouped in rounds of `limit` samples. After a round
+    the limit is multiplied by `backoff` when more than `max_error_rate` of
+    the fetches failed, or when the median time per MiB exceeds
+    `latency_tolerance` times the best round seen. Otherwise it grows by one,
+    provided work was held back by the limit during the round (see
+    `throttled`) and the previous increase raised throughput by at least
+    `min_gain`.
+
+    Fetches started before the last change are left out, so a decision is
+    only judged on fetches that ran under it.
+    """
+
+    backoff = 0.5
+    max_error_rate = 0.2
+    latency_tolerance = 2.0
+    min_gain = 0.05
+    # Let the latency baseline creep up, the network is not always this fast
+    baseline_drift = 0.1
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16):
+        if not 1 <= minimum <= maximum:
+            raise ValueError('Concurrency bounds must be 1 <= min <= max')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.throughput = 0.0
+        self.error_rate = 0.0
+        self.latency = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self._samples: list[Sample] = []
+        self._changed_at = time.monotonic()
+        self._increased = False
+        self._throttled = False
+        self._base_latency: float | None = None
+        self._lock = threading.Lock()
+
+    def throttled(self):
+        """Note that a download was waiting on the limit."""
+        self._throttled = True
+
+    def record(self, started_at: float, size: int = 0, error: bool = False):
+        """
+        Record a fetch that started at `started_at` (`time.monotonic()`)
+        and downloaded `size` bytes, or failed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if started_at < self._changed_at:
+                return
+            self._samples.append(Sample(started_at, now, size, error))
+            if len(self._samples) >= self.limit:
+                samples, self._samples = self._samples, []
+                self._adjust(samples, now)
+
+    def _adjust(self, samples: list[Sample], now: float):
+        elapsed = now - min(s.started_at for s in samples)
+        fetched = sum(s.size for s in samples if not s.error)
+        latencies = [s.latency for s in samples if s.latency is not None]
+        throughput = fetched / elapsed if elapsed > 0 else 0.0
+        previous, self.throughput = self.throughput, throughput
+        self.error_rate = sum(s.error for s in samples) / len(samples)
+        self.latency = statistics.median(latencies) if latencies else 0.0
+
+        base = self._base_latency
+        if latencies:
+            self._base_latency = (
+                self.latency
+                if base is None
+                else min(self.latency, base * (1 + self.baseline_drift))
+            )
+
+        if self.error_rate > self.max_error_rate:
+            self._decrease(now, f'{self.error_rate:.0%} of fetches failed')
+        elif base and self.latency > base * self.latency_tolerance:
+            self._decrease(
+                now, f'{self.latency:.1f}s/MiB against {base:.1f}s/MiB'
+            )
+        elif self._increased and throughput < previous * (1 + self.min_gain):
+            # The last increase did not pay off, hold for a round
+            self._increased = False
+        elif self._throttled and self.limit < self.maximum:
+            self._set(self.limit + 1, now, 'healthy round')
+            self._increased = True
+            self.increases += 1
+        self._throttled = False
+
+    def _decrease(self, now: float, reason: str):
+        self._increased = False
+        new = max(self.minimum, int(self.limit * self.backoff))
+        if new < self.limit:
+            self.decreases += 1
+            self._set(new, now, reason)
+
+    def _set(self, limit: int, now: float, reason: str):
+        logger.info(
+            'Download concurrency %s -> %s (%s)', self.limit, limit, reason
+        )
+        self.limit = limit
+        self._changed_at = now
+
+    def as_dict(self) -> dict:
+        return {
+            'limit': self.limit,
+            'minimum': self.minimum,
+            'maximum': self.maximum,
+            'throughput': round(self.throughput, 1),
+            'error_rate': round(self.error_rate, 3),
+            'latency': round(self.latency, 3),
+            'increases': self.increases,
+            'decreases': self.decreases,
+        }
@@ -0,0 +1,345 @@
+"""
+Hedged audio fetching with per-provider circuit breakers.
+
+A fetch normally starts streaming within a second or two, but now and then
+YouTube Music sits on a request for much longer or fails outright. Each
+track is given a short list of candidate URLs: the match, the same video on
+YouTube and the runner-up matches. When the running fetch has not received
+its first byte by the p95 time-to-first-byte of its provider, the next
+candidate is started next to it and whichever finishes first is kept.
+"""
+
+import contextvars
+import logging
+import queue
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+
+from spotdl.providers.audio.base import AudioProviderError
+
+from downtify.profiling import attached, current_profile
+from downtify.tracing import Span, start_span
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+Download = Callable[[str, Path, Callable[[dict], None]], tuple[Path, dict]]
+
+
+def provider_of(url: str) -> str:
+    host = urlparse(url).netloc
+    if host == 'music.youtube.com':
+        return 'youtube-music'
+    if host.endswith(('youtube.com', 'youtu.be')):
+        return 'youtube'
+    return host or 'unknown'
+
+
+def candidates(urls: list[str], limit: int = 3) -> list[str]:
+    """
+    Unique fetch candidates in order, each YouTube Music URL followed by the
+    same video on YouTube.
+    """
+    result: list[str] = []
+    for url in urls:
+        alternatives = [url]
+        if provider_of(url) == 'youtube-music':
+            video_id = parse_qs(urlparse(url).query).get('v', [None])[0]
+            if video_id:
+                alternatives.append(
+                    f'https://www.youtube.com/watch?v={video_id}'
+                )
+        result.extend(u for u in alternatives if u not in result)
+    return result[:limit]
+
+
+class Cancelled(Exception):
+    """Raised from the progress hook to stop a fetch that lost the race"""
+
+
+class CircuitBreaker:
+    """
+    Stop sending fetches to a provider after `threshold` failures in a row.
+
+    Once `reset_timeout` seconds have passed, a single trial fetch is let
+    through; it closes the circuit again on success and reopens it on
+    failure.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 60.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> str | None:
+        """
+        The state a fetch is let through in, HALF_OPEN for the trial
+        fetch, or None while the circuit is open.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return CLOSED
+            if self.state == OPEN and (
+                time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = HALF_OPEN
+                return HALF_OPEN
+            return None
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give up a trial fetch that was cancelled before it could tell"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+
+@dataclass(eq=False)
+class Attempt:
+    url: str
+    provider: str
+    directory: Path
+    span: Span
+    started_at: float = field(default_factory=time.monotonic)
+    deadline: float = 0.0
+    first_byte_at: float | None = None
+    path: Path | None = None
+    info: dict | None = None
+    error: BaseException | None = None
+    trial: bool = False
+    first_byte: threading.Event = field(default_factory=threading.Event)
+    _cancelled: bool = False
+    _finished: bool = False
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def progress(self, status: dict):
+        """yt-dlp progress hook"""
+        if self._cancelled:
+            raise Cancelled(self.url)
+        if self.first_byte_at is None and (
+            status.get('downloaded_bytes') or status['status'] == 'finished'
+        ):
+            self.first_byte_at = time.monotonic()
+            self.first_byte.set()
+
+    def finish(self) -> bool:
+        """Mark the attempt done, False when it already lost the race"""
+        with self._lock:
+            self._finished = True
+            if self._cancelled:
+                self.cleanup()
+            return not self._cancelled
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            if self._finished:
+                self.cleanup()
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class HedgedFetcher:
+    """
+    Fetch the first candidate that a closed circuit allows, start the next
+    one when it misses its first byte deadline or fails, and return the
+    first successful `Attempt`.
+
+    Attempts download into their own directory below `directory`, on
+    threads that carry the caller's trace context and profile. Circuit
+    breakers and first byte times are shared by every fetch.
+    """
+
+    def __init__(
+        self,
+        directory: Path | None = None,
+        default_deadline: float = 10.0,
+        deadline_bounds: tuple[float, float] = (2.0, 30.0),
+    ):
+        self.directory = directory
+        self.default_deadline = default_deadline
+        self.deadline_bounds = deadline_bounds
+        self.min_samples = 20
+        self.hedges = 0
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._first_byte: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            if provider not in self.breakers:
+                self.breakers[provider] = CircuitBreaker()
+            return self.breakers[provider]
+
+    def deadline(self, provider: str) -> float:
+        """Seconds to wait for the first byte before hedging"""
+        with self._lock:
+            samples = list(self._first_byte.get(provider, ()))
+        if len(samples) < self.min_samples:
+            return self.default_deadline
+        p95 = statistics.quantiles(samples, n=20)[-1]
+        low, high = self.deadline_bounds
+        return min(max(p95, low), high)
+
+    def fetch(
+        self,
+        urls: list[str],
+        download: Download,
+        parent: Span | None = None,
+    ) -> Attempt:
+        """
+        `download(url, directory, progress_hook)` fetches a URL into
+        `directory` and returns `(path, info)`.
+        """
+        results: queue.SimpleQueue = queue.SimpleQueue()
+        pending = list(urls)
+        running: list[Attempt] = []
+        errors: list[str] = []
+
+        def launch(hedge: bool) -> Attempt | None:
+            while pending:
+                url = pending.pop(0)
+                provider = provider_of(url)
+                state = self.breaker(provider).allow()
+                if state is None:
+                    errors.append(f'{provider} circuit is open')
+                    continue
+                attempt = self._start(url, provider, hedge, parent)
+                attempt.trial = state == HALF_OPEN
+                # Log records and profile samples of the attempt belong to
+                # the job and track that asked for it
+                context = contextvars.copy_context()
+                threading.Thread(
+                    target=context.run,
+                    args=(self._run, attempt, download, results),
+                    name=f'downtify-fetch-{provider}',
+                    daemon=True,
+                ).start()
+                running.append(attempt)
+                return attempt
+            return None
+
+        current = launch(hedge=False)
+        while running:
+            timeout = None
+            if pending and not current.first_byte.is_set():
+                timeout = max(current.deadline - time.monotonic(), 0)
+            try:
+                done = results.get(timeout=timeout)
+            except queue.Empty:
+                if not current.first_byte.is_set():
+                    logger.info(
+                        'No data from %s after %.1fs, hedging',
+                        current.url,
+                        time.monotonic() - current.started_at,
+                    )
+                    current = launch(hedge=True) or current
+                continue
+
+            running.remove(done)
+            if done.error is None:
+                for other in running:
+                    # Only a cancelled trial leaves its circuit undecided;
+                    # the others may be another track's trial
+                    if other.trial:
+                        self.breaker(other.provider).release()
+                    other.cancel()
+                return done
+            errors.append(f'{done.provider}: {done.error}')
+            if not running:
+                current = launch(hedge=True) or current
+
+        if not errors:
+            raise AudioProviderError('No candidate to fetch')
+        raise AudioProviderError('; '.join(errors))
+
+    def _start(
+        self,
+        url: str,
+        provider: str,
+        hedge: bool,
+        parent: Span | None,
+    ) -> Attempt:
+        if hedge:
+            with self._lock:
+                self.hedges += 1
+        attempt = Attempt(
+            url=url,
+            provider=provider,
+            directory=Path(tempfile.mkdtemp(dir=self.directory)),
+            span=start_span(
+                'fetch-attempt',
+                parent,
+                provider=provider,
+                url=url,
+                hedge=hedge,
+            ),
+        )
+        attempt.deadline = attempt.started_at + self.deadline(provider)
+        return attempt
+
+    def _run(
+        self, attempt: Attempt, download: Download, results: queue.SimpleQueue
+    ):
+        with attached(current_profile(), 'fetch'):
+            self._download(attempt, download, results)
+
+    def _download(
+        self, attempt: Attempt, download: Download, results: queue.SimpleQueue
+    ):
+        try:
+            attempt.path, attempt.info = download(
+                attempt.url, attempt.directory, attempt.progress
+            )
+        except Exception as error:
+            attempt.error = error
+
+        if attempt.first_byte_at is not None:
+            self._record_first_byte(attempt)
+        if not attempt.finish():
+            attempt.span.set(cancelled=True)
+            attempt.span.end()
+            return
+
+        breaker = self.breaker(attempt.provider)
+        if attempt.error is None:
+            breaker.success()
+        else:
+            breaker.failure()
+            attempt.span.fail(attempt.error)
+            attempt.cleanup()
+        attempt.span.end()
+        results.put(attempt)
+
+    def _record_first_byte(self, attempt: Attempt):
+        # Only the time until the first byte matters, the rest depends on
+        # the length of the track
+        elapsed = attempt.first_byte_at - attempt.started_at
+        with self._lock:
+            self._first_byte.setdefault(
+                attempt.provider, deque(maxlen=200)
+            ).append(elapsed)
@@ -0,0 +1,222 @@
+"""
+Persistent cache of Spotify track to audio provider matches.
+
+Matching a Spotify track to a YouTube (Music) video is the slowest and least
+reliable step of a download. The chosen match is stored in SQLite keyed by
+the Spotify track ID, so a repeat download goes straight to the fetch step.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlparse
+
+from spotdl.utils.formatter import create_search_query, create_song_title
+from spotdl.utils.matching import order_results
+
+logger = logging.getLogger(__name__)
+
+# spotdl stops searching at a result scoring this much
+CERTAIN_SCORE = 80.0
+
+
+@dataclass
+class Match:
+    song_id: str
+    provider: str
+    url: str
+    score: float
+    candidates: list[tuple[str, float]] = field(default_factory=list)
+    matched_at: float = field(default_factory=time.time)
+
+    @property
+    def video_id(self) -> str:
+        parsed = urlparse(self.url)
+        return parse_qs(parsed.query).get('v', [parsed.path.lstrip('/')])[0]
+
+    def as_dict(self) -> dict:
+        return {
+            'song_id': self.song_id,
+            'provider': self.provider,
+            'video_id': self.video_id,
+            'url': self.url,
+            'score': self.score,
+            'candidates': self.candidates,
+            'matched_at': self.matched_at,
+        }
+
+
+class MatchCache:
+    """SQLite backed match cache, entries expire after `ttl` seconds."""
+
+    def __init__(self, path: str, ttl: float = 30 * 24 * 3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS matches ('
+                ' song_id TEXT PRIMARY KEY,'
+                ' provider TEXT NOT NULL,'
+                ' url TEXT NOT NULL,'
+                ' score REAL NOT NULL,'
+                ' candidates TEXT NOT NULL,'
+                ' matched_at REAL NOT NULL)'
+            )
+
+    def get(self, song_id: str) -> Match | None:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT song_id, provider, url, score, candidates, matched_at'
+                ' FROM matches WHERE song_id = ?',
+                (song_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        match = Match(*row[:4], json.loads(row[4]), row[5])
+        if time.time() - match.matched_at > self.ttl:
+            self.invalidate(song_id)
+            return None
+        return match
+
+    def put(self, match: Match):
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    match.song_id,
+                    match.provider,
+                    match.url,
+                    match.score,
+                    json.dumps(match.candidates),
+                    match.matched_at,
+                ),
+            )
+
+    def invalidate(self, song_id: str | None = None) -> int:
+        """Drop the entry of `song_id`, or every entry when it is None."""
+        with self._lock, self._db:
+            if song_id is None:
+                cursor = self._db.execute('DELETE FROM matches')
+            else:
+                cursor = self._db.execute(
+                    'DELETE FROM matches WHERE song_id = ?', (song_id,)
+                )
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._db.execute('SELECT COUNT(*) FROM matches').fetchone()
+        return row[0]
+
+
+def _record(scores: dict[str, float], results: dict):
+    for result, score in results.items():
+        scores[result.url] = max(scores.get(result.url, 0), score)
+
+
+def _ranked(scores: dict[str, float], url: str, score: float) -> list:
+    others = sorted(
+        ((u, round(s, 2)) for u, s in scores.items() if u != url),
+        key=lambda item: -item[1],
+    )
+    return [(url, round(score, 2)), *others]
+
+
+def _search_isrc(provider, song, only_verified, scores) -> tuple:
+    """The ISRC step of the search: its result URLs and its choice, if any"""
+    results = provider.get_results(song.isrc)
+    if only_verified:
+        results = [result for result in results if result.verified]
+    urls = [result.url for result in results]
+
+    # A single verified ISRC result is taken without scoring
+    if len(results) == 1 and results[0].verified:
+        return urls, (results[0].url, CERTAIN_SCORE)
+
+    isrc_scores = order_results(results, song, provider.search_query)
+    _record(scores, isrc_scores)
+    if isrc_scores:
+        best, score = max(isrc_scores.items(), key=lambda item: item[1])
+        if score > CERTAIN_SCORE:
+            return urls, (best.url, score)
+    return urls, None
+
+
+def rank_results(provider, song, only_verified: bool = False) -> list:
+    """
+    Search one audio provider for `song`, returning the chosen result first
+    and then the other results seen, best first.
+
+    The choice is the one spotdl's `AudioProvider.search` makes, step for
+    step; the scores and runner-up results are kept on top of it.
+    """
+    query = create_song_title(song.name, song.artists).lower()
+    if provider.search_query:
+        query = create_search_query(
+            song, provider.search_query, False, None, True
+        )
+
+    scores: dict[str, float] = {}
+    isrc_urls: list[str] = []
+    if song.isrc and provider.SUPPORTS_ISRC and not provider.search_query:
+        isrc_urls, choice = _search_isrc(provider, song, only_verified, scores)
+        if choice is not None:
+            return _ranked(scores, *choice)
+
+    results: dict = {}
+    for options in provider.GET_RESULTS_OPTS:
+        search_results = provider.get_results(query, **options)
+        if only_verified:
+            search_results = [r for r in search_results if r.verified]
+
+        # A text search result that also came up for the ISRC wins
+        isrc_result = next(
+            (r for r in search_results if r.url in isrc_urls), None
+        )
+        if isrc_result:
+            url = isrc_result.url
+            return _ranked(scores, url, scores.get(url, CERTAIN_SCORE))
+
+        if provider.filter_results:
+            new_results = order_results(
+                search_results, song, provider.search_query
+            )
+        else:
+            new_results = {search_results[0]: 100.0} if search_results else {}
+        _record(scores, new_results)
+
+        if new_results:
+            best, score = provider.get_best_result(new_results)
+            if score >= CERTAIN_SCORE and best.verified:
+                return _ranked(scores, best.url, score)
+            results.update(new_results)
+
+    if not results:
+        return []
+    best, score = provider.get_best_result(results)
+    return _ranked(scores, best.url, score)
+
+
+def find_match(downloader, song, keep: int = 3) -> Match:
+    """Search every audio provider in order and return the best match."""
+    for provider in downloader.audio_providers:
+        ranked = rank_results(
+            provider, song, downloader.settings['only_verified_results']
+        )
+        if ranked:
+            url, score = ranked[0]
+            return Match(
+                song_id=song.song_id,
+                provider=provider.name,
+                url=url,
+                score=score,
+                candidates=ranked[:keep],
+            )
+        logger.debug('%s failed to find %s', provider.name, song.display_name)
+
+    raise LookupError(f'No results found for song: {song.display_name}')
@@ -0,0 +1,18 @@
+"""
+Prometheus text exposition of the download engine state.
+"""
+
+
+def render(metrics: list[tuple[str, str, str, float | dict]]) -> str:
+    """
+    Format `(name, type, help, value)` tuples as Prometheus text. `value`
+    may be a dict of `{labels: value}` such as `{'provider="youtube"': 1}`.
+    """
+    lines = []
+    for name, kind, description, value in metrics:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        if isinstance(value, dict):
+            lines += [f'{name}{{{labels}}} {v}' for labels, v in value.items()]
+        else:
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,266 @@
+"""
+Per-track download pipeline: match, fetch, transcode and tag.
+
+This follows spotdl's `Downloader.search_and_download` with the settings
+Downtify uses, but runs every stage in its own trace span and raises errors
+instead of only logging them, so the scheduler can report them per track.
+"""
+
+import logging
+import shutil
+import time
+from pathlib import Path
+
+from spotdl.providers.audio import AudioProvider
+from spotdl.providers.audio.base import AudioProviderError
+from spotdl.utils.config import get_temp_path
+from spotdl.utils.ffmpeg import FFmpegError, convert
+from spotdl.utils.formatter import create_file_name
+from spotdl.utils.metadata import MetadataError, embed_metadata
+from spotdl.utils.search import reinit_song
+
+from downtify.concurrency import AIMDController
+from downtify.hedging import Attempt, HedgedFetcher, candidates
+from downtify.match_cache import MatchCache, find_match
+from downtify.streaming import PROGRESSIVE_FORMATS, GrowingFile
+from downtify.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Fields spotdl needs for tagging, a song missing any of them is refetched
+REQUIRED_METADATA = (
+    'genres',
+    'disc_count',
+    'tracks_count',
+    'track_number',
+    'album_id',
+    'album_artist',
+)
+
+
+class Pipeline:
+    def __init__(
+        self,
+        downloader,
+        match_cache: MatchCache | None = None,
+        limiter: AIMDController | None = None,
+        fetcher: HedgedFetcher | None = None,
+    ):
+        self.downloader = downloader
+        self.settings = downloader.settings
+        self.match_cache = match_cache
+        self.limiter = limiter
+        self.fetcher = fetcher or HedgedFetcher(get_temp_path())
+
+    def run(self, song, stream: GrowingFile | None = None) -> Path:
+        """
+        Download `song` and return the path of the tagged file. `stream` is
+        told where the audio is written while it is being converted.
+        """
+        stream = stream or GrowingFile()
+        try:
+            return self._run(song, stream)
+        except Exception as error:
+            stream.finish(error=f'{error.__class__.__name__}: {error}')
+            raise
+
+    def _run(self, song, stream: GrowingFile) -> Path:
+        with span('match', **{'song.url': song.url}) as current:
+            song = self.complete_metadata(song)
+            current.set(**{'song.name': song.display_name})
+            output_file = self.output_file(song)
+            if output_file.exists() and self.settings['overwrite'] != 'force':
+                current.set(skipped=True)
+                logger.info(
+                    'Skipping %s (file already exists)', song.display_name
+                )
+                stream.finish(output_file)
+                return output_file
+            urls, source = self.match(song)
+            current.set(**{'match.url': urls[0], 'match.source': source})
+
+        attempt = self.convert(song, urls, source, output_file, stream)
+        try:
+            with span('tag'):
+                self.tag(song, output_file)
+            stream.finish(output_file)
+        finally:
+            attempt.cleanup()
+
+        logger.info('Downloaded "%s": %s', song.display_name, attempt.url)
+        return output_file
+
+    def convert(
+        self,
+        song,
+        urls: list[str],
+        source: str,
+        output_file: Path,
+        stream: GrowingFile,
+    ) -> Attempt:
+        """
+        Fetch and transcode `song` to `output_file`. ffmpeg writes next to
+        the fetched audio first, where `stream` readers follow it.
+        """
+        attempt = None
+        try:
+            attempt = self.fetch(urls)
+            converted = self.converted_file(attempt, stream)
+            with span('transcode', format=self.settings['format']):
+                self.transcode(attempt.path, converted, attempt.info)
+            shutil.copyfile(converted, output_file)
+        except Exception:
+            if attempt is not None:
+                attempt.cleanup()
+            if self.match_cache and song.song_id and source != 'song':
+                # The video may be gone or the match wrong, search again
+                self.match_cache.invalidate(song.song_id)
+            raise
+        return attempt
+
+    @staticmethod
+    def complete_metadata(song):
+        if song.name is None or None in [
+            getattr(song, name) for name in REQUIRED_METADATA
+        ]:
+            return reinit_song(song)
+        return song
+
+    def output_file(self, song) -> Path:
+        output_file = create_file_name(
+            song=song,
+            template=self.settings['output'],
+            file_extension=self.settings['format'],
+            restrict=self.settings['restrict'],
+            file_name_length=self.settings['max_filename_length'],
+        )
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        return output_file
+
+    def match(self, song) -> tuple[list[str], str]:
+        """
+        Return the candidate download URLs of `song`, best first, and where
+        the match came from: the song itself, the match cache or a search.
+        """
+        if song.download_url:
+            return candidates([song.download_url]), 'song'
+        if self.match_cache is None or not song.song_id:
+            return candidates([self.downloader.search(song)]), 'search'
+
+        match = self.match_cache.get(song.song_id)
+        source = 'cache'
+        if match is None:
+            match = find_match(self.downloader, song)
+            self.match_cache.put(match)
+            source = 'search'
+        urls = [match.url] + [url for url, _ in match.candidates]
+        return candidates(urls), source
+
+    def converted_file(self, attempt: Attempt, stream: GrowingFile) -> Path:
+        """Where ffmpeg writes, announced to `stream` if playable early."""
+        output_format = self.settings['format']
+        converted = attempt.directory / f'converted.{output_format}'
+        if output_format in PROGRESSIVE_FORMATS:
+            stream.start(converted)
+        return converted
+
+    def audio_provider(self) -> AudioProvider:
+        return AudioProvider(
+            output_format=self.settings['format'],
+            cookie_file=self.settings['cookie_file'],
+            search_query=self.settings['search_query'],
+            filter_results=self.settings['filter_results'],
+            yt_dlp_args=self.settings['yt_dlp_args'],
+        )
+
+    def fetch(self, urls: list[str]) -> Attempt:
+        """Fetch the first of `urls` to answer, see `HedgedFetcher`."""
+        started = time.monotonic()
+        try:
+            with span('fetch', **{'match.url': urls[0]}) as current:
+                attempt = self.fetcher.fetch(urls, self.download, current)
+                current.set(**{'fetch.url': attempt.url})
+        except Exception:
+            if self.limiter is not None:
+                self.limiter.record(started, error=True)
+            raise
+
+        if self.limiter is not None:
+            size = attempt.path.stat().st_size if attempt.path.exists() else 0
+            self.limiter.record(started, size)
+        return attempt
+
+    def download(
+        self, url: str, directory: Path, progress_hook
+    ) -> tuple[Path, dict]:
+        """Download `url` into `directory`, reporting to `progress_hook`."""
+        handler = self.audio_provider().audio_handler
+        # Two attempts may fetch the same video ID, keep them apart
+        handler.params['outtmpl']['default'] = str(
+            directory / '%(id)s.%(ext)s'
+        )
+        handler.add_progress_hook(progress_hook)
+        try:
+            info = handler.extract_info(url, download=True)
+        except Exception as error:
+            raise AudioProviderError(
+                f'YT-DLP download error - {url}'
+            ) from error
+        if not info:
+            raise AudioProviderError(f'No metadata found for {url}')
+        return directory / f'{info["id"]}.{info["ext"]}', info
+
+    def transcode(self, temp_file: Path, output_file: Path, info: dict):
+        bitrate = self.settings['bitrate']
+        try:
+            if bitrate in {'auto', 'disable', None} and (
+                temp_file.suffix == output_file.suffix
+            ):
+                shutil.move(str(temp_file), output_file)
+                return
+
+            if bitrate in {'auto', None}:
+                abr = info.get('abr')
+                bitrate = f'{int(abr)}k' if abr else 'copy'
+            elif bitrate == 'disable':
+                bitrate = None
+
+            success, result = convert(
+                input_file=temp_file,
+                output_file=output_file,
+                ffmpeg=self.downloader.ffmpeg,
+                output_format=self.settings['format'],
+                bitrate=bitrate,
+                ffmpeg_args=self.settings['ffmpeg_args'],
+            )
+        finally:
+            temp_file.unlink(missing_ok=True)
+
+        if not success:
+            output_file.unlink(missing_ok=True)
+            # ffmpeg runs with `-v debug`, the reason is on the last line
+            lines = (result or {}).get('error', '').strip().splitlines()
+            reason = lines[-1] if lines else 'unknown error'
+            raise FFmpegError(
+                f'Failed to convert {output_file.name}: {reason}'
+            )
+
+    def tag(self, song, output_file: Path):
+        try:
+            lyrics = self.downloader.search_lyrics(song)
+            if lyrics:
+                song.lyrics = lyrics
+        except Exception as error:
+            logger.debug('Could not search for lyrics: %s', error)
+
+        try:
+            embed_metadata(
+                output_file,
+                song,
+                id3_separator=self.settings['id3_separator'],
+                skip_album_art=self.settings['skip_album_art'],
+            )
+        except Exception as error:
+            raise MetadataError(
+                'Failed to embed metadata to the song'
+            ) from error
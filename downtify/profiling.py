@@ -0,0 +1,217 @@
+"""
+Opt-in wall-clock sampling profiler for requests and download jobs.
+
+A single sampler thread wakes up every `interval` seconds while at least one
+profile is active and records the stack of every thread attached to it, so
+nothing runs at all when profiling is off. Finished profiles are written as
+collapsed stacks (for flamegraph.pl and friends) and speedscope JSON.
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+_current: contextvars.ContextVar['Profile | None'] = contextvars.ContextVar(
+    'downtify_profile', default=None
+)
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f'{module}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+def collapse(frame) -> tuple[str, ...]:
+    stack = []
+    while frame is not None:
+        stack.append(frame_name(frame))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class Profile:
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples: Counter = Counter()
+        self.threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, thread_id: int | None = None, label: str | None = None):
+        """Sample `thread_id` (the calling thread by default) from now on."""
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self.threads[thread_id] = label or threading.current_thread().name
+
+    def detach(self, thread_id: int | None = None):
+        with self._lock:
+            self.threads.pop(thread_id or threading.get_ident(), None)
+
+    def sample(self, frames: dict):
+        with self._lock:
+            for thread_id, label in self.threads.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[label, collapse(frame)] += 1
+
+    def collapsed(self) -> str:
+        return ''.join(
+            f'{";".join((label, *stack))} {count}\n'
+            for (label, stack), count in sorted(self.samples.items())
+        )
+
+    def speedscope(self) -> dict:
+        frames: dict[str, int] = {}
+        profiles: dict[str, dict] = {}
+        weight = self.interval * 1000
+
+        for (label, stack), count in sorted(self.samples.items()):
+            profile = profiles.setdefault(
+                label,
+                {
+                    'type': 'sampled',
+                    'name': f'{self.name} [{label}]',
+                    'unit': 'milliseconds',
+                    'startValue': 0,
+                    'endValue': 0,
+                    'samples': [],
+                    'weights': [],
+                },
+            )
+            profile['samples'].append([
+                frames.setdefault(name, len(frames)) for name in stack
+            ])
+            profile['weights'].append(count * weight)
+            profile['endValue'] += count * weight
+
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': self.name,
+            'exporter': 'downtify',
+            'shared': {'frames': [{'name': name} for name in frames]},
+            'profiles': list(profiles.values()),
+        }
+
+
+class Profiler:
+    """Run the sampler and store finished profiles in `directory`."""
+
+    def __init__(self, directory: str, interval: float = 0.01, keep: int = 50):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self._active: list[Profile] = []
+        self._wake = threading.Condition()
+        self._thread: threading.Thread | None = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, name: str) -> Profile:
+        profile = Profile(name, self.interval)
+        with self._wake:
+            self._active.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='downtify-profiler', daemon=True
+                )
+                self._thread.start()
+            self._wake.notify()
+        return profile
+
+    def stop(self, profile: Profile) -> list[str]:
+        """Stop sampling `profile` and write it to disk."""
+        with self._wake:
+            if profile not in self._active:
+                return []
+            self._active.remove(profile)
+        profile.duration = time.time() - profile.started_at
+
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(profile.started_at))
+        base = os.path.join(self.directory, f'{stamp}-{profile.name}')
+        paths = [f'{base}.collapsed.txt', f'{base}.speedscope.json']
+        with open(paths[0], 'w', encoding='utf-8') as file:
+            file.write(profile.collapsed())
+        with open(paths[1], 'w', encoding='utf-8') as file:
+            json.dump(profile.speedscope(), file)
+
+        self._prune()
+        return paths
+
+    @contextmanager
+    def profile(self, name: str, enabled: bool = True):
+        """Profile the calling thread for the duration of the block."""
+        if not enabled:
+            yield None
+            return
+        profile = self.start(name)
+        profile.attach(label='request')
+        token = _current.set(profile)
+        try:
+            yield profile
+        finally:
+            _current.reset(token)
+            self.stop(profile)
+
+    def list(self) -> list[dict]:
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            path = os.path.join(self.directory, name)
+            profiles.append({
+                'file': name,
+                'size': os.path.getsize(path),
+                'created_at': os.path.getmtime(path),
+            })
+        return profiles
+
+    def path(self, filename: str) -> str | None:
+        if os.path.basename(filename) != filename:
+            return None
+        path = os.path.join(self.directory, filename)
+        return path if os.path.isfile(path) else None
+
+    def _prune(self):
+        # Two files per profile
+        files = sorted(os.listdir(self.directory), reverse=True)
+        for name in files[self.keep * 2 :]:
+            os.remove(os.path.join(self.directory, name))
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while not self._active:
+                    self._wake.wait()
+                active = list(self._active)
+            frames = sys._current_frames()
+            for profile in active:
+                profile.sample(frames)
+            del frames
+            time.sleep(self.interval)
+
+
+def current_profile() -> Profile | None:
+    """The profile the calling context is attached to, if any."""
+    return _current.get()
+
+
+@contextmanager
+def attached(profile: Profile | None, label: str | None = None):
+    """Sample the calling thread into `profile` for the block, if any."""
+    if profile is None:
+        yield
+        return
+    profile.attach(label=label)
+    token = _current.set(profile)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        profile.detach()
@@ -0,0 +1,223 @@
+"""
+Streaming resolution of URLs into songs.
+
+`Spotdl.search` reads a whole playlist, builds every `Song` and fetches the
+full metadata of each one before returning, so a 10k track playlist takes
+minutes and hundreds of MB before the first download starts. `iter_songs`
+reads a playlist one page at a time and yields its songs as each page
+arrives, with only the simple metadata a playlist page carries; the
+pipeline completes the metadata of a track right before downloading it.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterator
+
+from spotdl import Spotdl
+from spotdl.types.song import Song
+from spotdl.utils.search import get_simple_songs
+from spotdl.utils.spotify import SpotifyClient
+from spotipy import Spotify
+
+logger = logging.getLogger(__name__)
+
+# Only what `song_from_item` reads, a full playlist item is ~10x larger
+ITEM_FIELDS = (
+    'next,total,items(track(id,name,type,is_local,duration_ms,explicit,'
+    'disc_number,track_number,external_urls,external_ids,artists(name),'
+    'album(id,name,album_type,release_date,total_tracks,images,'
+    'artists(name))))'
+)
+PLAYLIST_FIELDS = 'name,owner(display_name),images'
+SPOTIFY_CACHE_SIZE = 256
+
+
+def is_playlist(url: str) -> bool:
+    return 'open.spotify.com' in url and 'playlist' in url and '|' not in url
+
+
+def largest_image(images: list[dict] | None) -> str | None:
+    if not images:
+        return None
+    return max(
+        images, key=lambda i: (i.get('width') or 0) * (i.get('height') or 0)
+    )['url']
+
+
+class BoundedCache(OrderedDict):
+    """A dict that only keeps the `size` entries set last"""
+
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+        self._lock = threading.Lock()
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.size:
+                self.popitem(last=False)
+
+
+def bound_spotify_cache(size: int = SPOTIFY_CACHE_SIZE):
+    """
+    Keep only the last `size` responses of spotdl's client, which otherwise
+    keeps every one for the life of the process. The pipeline completes
+    the metadata of every track with a track, artist and album request
+    (the album with the tracks and markets of the whole album), so the
+    cache would grow with every track ever downloaded. Tracks of the same
+    album, downloaded one after another, still share its responses.
+    """
+    SpotifyClient.cache = BoundedCache(size)
+
+
+def get_page(client: SpotifyClient, url: str, **params) -> dict | None:
+    """
+    GET one page of a paged response. spotdl's client keeps every response
+    for the life of the process, which would hold on to the whole playlist,
+    so pages go through the plain spotipy client instead.
+    """
+    return Spotify._get(client, url, **params)
+
+
+def iter_pages(
+    client: SpotifyClient, url: str, page_size: int = 100
+) -> Iterator[dict]:
+    """Yield the pages of the items of playlist `url`, fetching them lazily"""
+    playlist_id = client._get_id('playlist', url)
+    page = get_page(
+        client,
+        f'playlists/{playlist_id}/items',
+        limit=page_size,
+        offset=0,
+        fields=ITEM_FIELDS,
+        additional_types='track',
+    )
+    while page is not None:
+        yield page
+        if not page.get('next'):
+            return
+        # The next URL keeps the fields and limit of the first request
+        page = get_page(client, page['next'])
+
+
+def song_from_item(item, **list_data) -> Song | None:
+    """
+    Build a song from a playlist item the way spotdl's `Playlist` does, or
+    return None for the items spotdl skips: local files, podcast episodes
+    and unavailable tracks.
+    """
+    if not isinstance(item, dict) or item.get('track') is None:
+        return None
+    track = item['track']
+    if track.get('is_local') or track.get('type') != 'track':
+        logger.warning(
+            'Skipping track: %s local tracks and %s are not supported',
+            track.get('id'),
+            track.get('type'),
+        )
+        return None
+    if track.get('id') is None or track.get('duration_ms') == 0:
+        return None
+
+    album = track.get('album', {})
+    release_date = album.get('release_date')
+    artists = [artist['name'] for artist in track.get('artists', [])]
+    return Song.from_missing_data(
+        name=track['name'],
+        artists=artists,
+        artist=artists[0],
+        album_id=album.get('id'),
+        album_name=album.get('name'),
+        album_artist=album['artists'][0]['name']
+        if album.get('artists')
+        else None,
+        album_type=album.get('album_type'),
+        disc_number=track['disc_number'],
+        duration=int(track['duration_ms'] / 1000),
+        year=release_date[:4] if release_date else None,
+        date=release_date,
+        track_number=track['track_number'],
+        tracks_count=album.get('total_tracks'),
+        song_id=track['id'],
+        explicit=track['explicit'],
+        url=track['external_urls']['spotify'],
+        isrc=track.get('external_ids', {}).get('isrc'),
+        cover_url=largest_image(album.get('images')),
+        **list_data,
+    )
+
+
+def iter_playlist(
+    url: str,
+    client: SpotifyClient | None = None,
+    page_size: int = 100,
+    settings: dict | None = None,
+) -> Iterator[Song]:
+    """
+    Yield the songs of playlist `url` page by page. `settings` are the
+    downloader settings, for the playlist numbering options.
+    """
+    client = client or SpotifyClient()
+    settings = settings or {}
+    playlist = client.playlist(url, fields=PLAYLIST_FIELDS)
+    if playlist is None:
+        raise ValueError(f'Invalid playlist URL: {url}')
+
+    numbering = settings.get('playlist_numbering')
+    retain_cover = settings.get('playlist_retain_track_cover')
+    position = 0
+    for page in iter_pages(client, url, page_size):
+        for item in page['items']:
+            position += 1
+            song = song_from_item(
+                item,
+                list_name=playlist['name'],
+                list_url=url,
+                list_position=position,
+                list_length=page['total'],
+            )
+            if song is None:
+                continue
+            if numbering or retain_cover:
+                # Number the tracks as one album, as spotdl does
+                song.track_number = position
+                song.tracks_count = page['total']
+                song.album_name = playlist['name']
+                song.disc_number = song.disc_count = 1
+                song.album_artist = playlist['owner']['display_name']
+            if numbering:
+                song.cover_url = largest_image(playlist.get('images'))
+            yield song
+
+
+def simple_songs(spotdlc: Spotdl, url: str) -> list[Song]:
+    """Expand `url` into its songs, without their full metadata"""
+    settings = spotdlc.downloader.settings
+    return get_simple_songs(
+        [url],
+        use_ytm_data=settings['ytm_data'],
+        playlist_numbering=settings['playlist_numbering'],
+        album_type=settings['album_type'],
+        playlist_retain_track_cover=settings['playlist_retain_track_cover'],
+    )
+
+
+def iter_songs(
+    spotdlc: Spotdl, url: str, page_size: int = 100
+) -> Iterator[Song]:
+    """
+    Yield the songs of `url` as they are resolved. Playlists, the only
+    lists that grow to thousands of tracks, are paged; everything else is
+    resolved in one go.
+    """
+    if is_playlist(url):
+        yield from iter_playlist(
+            url,
+            page_size=page_size,
+            settings=spotdlc.downloader.settings,
+        )
+    else:
+        yield from simple_songs(spotdlc, url)
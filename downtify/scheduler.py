@@ -0,0 +1,467 @@
+"""
+Track-level download scheduler.
+
+Jobs submitted by different users are split into tracks and dispatched to a
+pool of worker threads using weighted fair queuing across submitters, so a
+large playlist cannot starve single-track requests from other users.
+"""
+
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+
+from downtify.concurrency import AIMDController
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def summarize(tracks: list['Track']) -> str:
+    """Collapse the status of several tracks into a single status"""
+    if tracks and all(t.status == FAILED for t in tracks):
+        return FAILED
+    if all(t.status in {DONE, FAILED} for t in tracks):
+        return DONE
+    if any(t.status != QUEUED for t in tracks):
+        return RUNNING
+    return QUEUED
+
+
+@dataclass(eq=False, slots=True)
+class Track:
+    song: Any
+    job: 'Job'
+    id: str = field(default_factory=new_id)
+    status: str = QUEUED
+    path: str | None = None
+    error: str | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+    name: str = ''
+    url: str | None = None
+
+    def __post_init__(self):
+        # Kept apart from `song`, which is dropped once the track is done
+        self.name = self.name or getattr(
+            self.song, 'display_name', str(self.song)
+        )
+        self.url = self.url or getattr(self.song, 'url', None)
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'url': self.url,
+            'status': self.status,
+            'file': self.path,
+            'error': self.error,
+            'stream': f'/stream/{self.job.id}/{self.id}',
+        }
+
+
+@dataclass(eq=False)
+class Job:
+    owner: str
+    id: str = field(default_factory=new_id)
+    tracks: list[Track] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished: int = 0
+    sources: dict[str, dict] = field(default_factory=dict)
+    context: dict = field(default_factory=dict)
+    feeding: bool = False
+    error: str | None = None
+    _pending: list[Track] = field(default_factory=list, repr=False)
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+    _callbacks: list[Callable[['Job'], None]] = field(
+        default_factory=list, repr=False
+    )
+
+    @property
+    def remaining(self) -> int:
+        return len(self.tracks) - self.finished
+
+    @property
+    def status(self) -> str:
+        if not self.tracks:
+            if self.feeding:
+                return QUEUED
+            return FAILED if self.error else DONE
+        status = summarize(self.tracks)
+        if self.feeding and status in {DONE, FAILED}:
+            return RUNNING
+        return status
+
+    def track_finished(self) -> bool:
+        self.finished += 1
+        return self._check_done()
+
+    def _check_done(self) -> bool:
+        if self.remaining == 0 and not self.feeding:
+            self._done.set()
+        return self._done.is_set()
+
+    def add_done_callback(self, callback: Callable[['Job'], None]):
+        """Call `callback(job)` once every track has finished."""
+        self._callbacks.append(callback)
+        if self._done.is_set():
+            self.run_callbacks()
+
+    def run_callbacks(self):
+        while True:
+            try:
+                callback = self._callbacks.pop(0)
+            except IndexError:
+                return
+            callback(self)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until every track of the job has finished."""
+        return self._done.wait(timeout)
+
+    def add_source(
+        self,
+        url: str,
+        tracks: list[Track],
+        error: str | None = None,
+        resolving: bool = False,
+    ):
+        """
+        Record which tracks a submitted URL expanded to. A `resolving` URL
+        may still get more tracks until `resolved` is called.
+        """
+        self.sources[url] = {
+            'tracks': tracks,
+            'error': error,
+            'resolving': resolving,
+        }
+
+    def resolved(self, url: str, error: str | None = None):
+        """Mark source `url` as fully resolved, or failed with `error`"""
+        source = self.sources[url]
+        source['error'] = source['error'] or error
+        source['resolving'] = False
+
+    @staticmethod
+    def source_status(source: dict) -> str:
+        if source['error']:
+            return FAILED
+        if source['resolving']:
+            # Finished tracks say nothing about the ones not resolved yet
+            started = any(t.status != QUEUED for t in source['tracks'])
+            return RUNNING if started else QUEUED
+        return summarize(source['tracks'])
+
+    def as_dict(self) -> dict:
+        data = {
+            'id': self.id,
+            'status': self.status,
+            'total': len(self.tracks),
+            'finished': self.finished,
+            'feeding': self.feeding,
+            'error': self.error,
+            'tracks': [track.as_dict() for track in self.tracks],
+        }
+        if self.sources:
+            data['sources'] = [
+                {
+                    'url': url,
+                    'status': self.source_status(source),
+                    'error': source['error'],
+                    'tracks': [track.id for track in source['tracks']],
+                }
+                for url, source in self.sources.items()
+            ]
+        return data
+
+
+@dataclass(eq=False)
+class _Owner:
+    name: str
+    weight: float = 1.0
+    vtime: float = 0.0
+    running: int = 0
+    jobs: list[Job] = field(default_factory=list)
+
+
+class TrackScheduler:
+    """
+    Weighted fair queuing of tracks across submitters.
+
+    Every submitter (IP address or API key) has a virtual clock that advances
+    by `1 / weight` for each track dispatched; the submitter with the lowest
+    clock goes next. The weight belongs to the submitter: the one given with
+    its latest submission counts for all of its jobs. Within a submitter,
+    the job with the fewest remaining tracks is served first.
+    `per_owner_limit` caps how many workers a single submitter may hold,
+    keeping a slot free for everybody else.
+
+    With a `limiter`, `workers` threads are started but only as many tracks
+    as the limiter currently allows run at once.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Track], str | None],
+        workers: int = 4,
+        per_owner_limit: int | None = None,
+        keep_jobs: int = 1000,
+        limiter: AIMDController | None = None,
+    ):
+        self.process = process
+        self.workers = workers
+        self.limiter = limiter
+        self._per_owner_limit = per_owner_limit
+        self.keep_jobs = keep_jobs
+        self.jobs: dict[str, Job] = {}
+        self._owners: dict[str, _Owner] = {}
+        self._weights: dict[str, float] = {}
+        self._vclock = 0.0
+        self._running = 0
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def concurrency(self) -> int:
+        # A raised limit is picked up when the next track finishes, as the
+        # limiter only changes on finished fetches
+        if self.limiter is None:
+            return self.workers
+        return min(self.limiter.limit, self.workers)
+
+    @property
+    def per_owner_limit(self) -> int:
+        return self._per_owner_limit or max(1, self.concurrency - 1)
+
+    @property
+    def queued(self) -> int:
+        with self._cond:
+            return sum(
+                len(job._pending)
+                for owner in self._owners.values()
+                for job in owner.jobs
+            )
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def submit(
+        self,
+        owner: str,
+        songs: list,
+        weight: float = 1.0,
+        context: dict | None = None,
+    ) -> Job:
+        """
+        Queue `songs` as a new job for `owner` and return the job. `context`
+        is kept on the job for the `process` callback to use.
+        """
+        job = Job(owner=owner, context=context or {})
+        with self._cond:
+            self._forget_finished()
+            self._set_weight(owner, weight)
+            self.jobs[job.id] = job
+            self._enqueue(job, [Track(song=song, job=job) for song in songs])
+            job._check_done()
+        return job
+
+    def submit_stream(
+        self,
+        owner: str,
+        songs: Iterable,
+        window: int = 100,
+        weight: float = 1.0,
+        context: dict | None = None,
+    ) -> Job:
+        """
+        Queue the songs of `songs` as they are produced, for an iterator
+        that resolves a large playlist lazily. A feeder thread pulls songs
+        only while fewer than `window` tracks of the job wait for a worker,
+        and finished tracks drop their song, so the songs held in memory
+        stay bounded however long the playlist is. The job is done once the
+        iterator is exhausted and every track has finished; an error raised
+        by the iterator ends the feed and is kept as `job.error`.
+        """
+        job = self.open_job(owner, weight, context)
+        threading.Thread(
+            target=self._feed,
+            args=(job, iter(songs), window),
+            name=f'downtify-feed-{job.id}',
+            daemon=True,
+        ).start()
+        return job
+
+    def open_job(
+        self, owner: str, weight: float = 1.0, context: dict | None = None
+    ) -> Job:
+        """
+        Create a job for `owner` that tracks are added to with `add` until
+        it is closed with `close`; it cannot finish before that.
+        """
+        job = Job(owner=owner, context=context or {}, feeding=True)
+        with self._cond:
+            self._forget_finished()
+            self._set_weight(owner, weight)
+            self.jobs[job.id] = job
+        return job
+
+    def add(
+        self, job: Job, songs: Iterable, window: int | None = None
+    ) -> list[Track]:
+        """
+        Queue `songs` on an open job and return their tracks. With a
+        `window`, each song waits until fewer than `window` tracks of the
+        job wait for a worker.
+        """
+        tracks = []
+        for song in songs:
+            track = Track(song=song, job=job)
+            with self._cond:
+                while window and len(job._pending) >= window:
+                    self._cond.wait()
+                self._enqueue(job, [track])
+            tracks.append(track)
+        return tracks
+
+    def close(self, job: Job, error: str | None = None):
+        """Stop adding to `job`, which is done once its tracks are."""
+        with self._cond:
+            job.error = job.error or error
+            job.feeding = False
+            for source in job.sources.values():
+                source['resolving'] = False
+            done = job._check_done()
+            self._cond.notify_all()
+        if done:
+            job.run_callbacks()
+
+    def _feed(self, job: Job, songs, window: int):
+        error = None
+        try:
+            self.add(job, songs, window)
+        except Exception as exception:
+            error = f'{exception.__class__.__name__}: {exception}'
+        finally:
+            self.close(job, error)
+
+    def _enqueue(self, job: Job, tracks: list[Track]):
+        if not tracks:
+            return
+        job.tracks.extend(tracks)
+        job._pending.extend(tracks)
+
+        state = self._owners.get(job.owner)
+        if state is None:
+            state = self._owners[job.owner] = _Owner(
+                name=job.owner, weight=self._weights.get(job.owner, 1.0)
+            )
+        if not state.jobs:
+            # An idle submitter must not bank credit while away
+            state.vtime = max(state.vtime, self._vclock)
+        if job not in state.jobs:
+            state.jobs.append(job)
+        self._start_workers()
+        self._cond.notify_all()
+
+    def _set_weight(self, owner: str, weight: float):
+        # Only submitters that are not weighted 1 are remembered
+        if weight == 1.0:
+            self._weights.pop(owner, None)
+        else:
+            self._weights[owner] = weight
+        if owner in self._owners:
+            self._owners[owner].weight = weight
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def _forget_finished(self):
+        excess = len(self.jobs) - self.keep_jobs + 1
+        for job_id in [
+            j for j, job in self.jobs.items() if job._done.is_set()
+        ]:
+            if excess <= 0:
+                break
+            del self.jobs[job_id]
+            excess -= 1
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work,
+                name=f'downtify-worker-{len(self._threads)}',
+                daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _next(self) -> tuple[_Owner, Track] | None:
+        waiting = [owner for owner in self._owners.values() if owner.jobs]
+        if self._running >= self.concurrency:
+            if waiting:
+                self._throttled()
+            return None
+
+        ready = [o for o in waiting if o.running < self.per_owner_limit]
+        if not ready:
+            if waiting and self._per_owner_limit is None:
+                # The per-user cap follows the limit, so this is throttling
+                self._throttled()
+            return None
+
+        owner = min(ready, key=lambda o: (o.vtime, o.running))
+        job = min(owner.jobs, key=lambda j: len(j._pending))
+        track = job._pending.pop(0)
+        if not job._pending:
+            owner.jobs.remove(job)
+
+        self._vclock = owner.vtime
+        owner.vtime += 1 / owner.weight
+        owner.running += 1
+        self._running += 1
+        return owner, track
+
+    def _throttled(self):
+        if self.limiter is not None:
+            self.limiter.throttled()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while (item := self._next()) is None:
+                    self._cond.wait()
+            owner, track = item
+            self._run(track)
+            with self._cond:
+                owner.running -= 1
+                self._running -= 1
+                if not (owner.jobs or owner.running) and (
+                    owner.vtime <= self._vclock
+                ):
+                    self._owners.pop(owner.name, None)
+                done = track.job.track_finished()
+                self._cond.notify_all()
+            if done:
+                track.job.run_callbacks()
+
+    def _run(self, track: Track):
+        track.status = RUNNING
+        track.started_at = time.monotonic()
+        try:
+            track.path = self.process(track)
+            track.status = DONE if track.path else FAILED
+            if track.path is None and track.error is None:
+                track.error = 'Download failed'
+        except Exception as error:
+            track.status = FAILED
+            track.error = f'{error.__class__.__name__}: {error}'
+        track.finished_at = time.monotonic()
+        track.song = None
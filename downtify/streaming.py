@@ -0,0 +1,103 @@
+"""
+Progressive streaming of tracks that are still being converted.
+
+ffmpeg writes the track to a partial file that readers follow as it grows.
+When the conversion is done the partial file is copied to the downloads
+directory and tagged there, so a reader that already holds the partial file
+keeps reading a file that is never rewritten under it.
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+# Formats a player can start on before the file is complete. An m4a file
+# needs its index, written last, so it is only streamed once finished.
+PROGRESSIVE_FORMATS = {'mp3', 'opus', 'ogg', 'flac'}
+
+
+class GrowingFile:
+    """A file that is being written, and readers following it."""
+
+    def __init__(self):
+        self.path: Path | None = None
+        self.error: str | None = None
+        self._started = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    def start(self, path: Path):
+        """Announce that `path` is being written from now on."""
+        self.path = path
+        self._started.set()
+
+    def finish(self, path: Path | None = None, error: str | None = None):
+        """
+        Mark the file complete. `path` is where it can be read from now on,
+        for readers that were not following the partial file.
+        """
+        if path is not None:
+            self.path = path
+        self.error = error
+        self._finished.set()
+        self._started.set()
+
+    def wait_started(self, timeout: float | None = None) -> bool:
+        return self._started.wait(timeout)
+
+    def follow(
+        self, chunk_size: int = 64 * 1024, poll: float = 0.2
+    ) -> Iterator[bytes]:
+        """Yield the content of the file as it is written, until finished."""
+        self._started.wait()
+        file = self._open(poll)
+        if file is None:
+            return
+
+        with file:
+            while True:
+                finished = self._finished.is_set()
+                chunk = file.read(chunk_size)
+                if chunk:
+                    yield chunk
+                elif finished:
+                    return
+                else:
+                    time.sleep(poll)
+
+    def _open(self, poll: float):
+        while True:
+            # `path` is replaced before `_finished` is set, so once finished
+            # is seen the path read after it is the final one
+            finished = self._finished.is_set()
+            if self.path is None or (finished and self.error):
+                return None
+            try:
+                return open(self.path, 'rb')
+            except FileNotFoundError:
+                # ffmpeg creates the partial file only once it has probed
+                # its input; after finishing, a missing file means failure
+                if finished:
+                    return None
+            time.sleep(poll)
+
+
+def stream_for(track) -> GrowingFile:
+    """The audio of a scheduled `track` as it is written, for `/stream`"""
+    streams = track.job.context.setdefault('streams', {})
+    stream = streams.get(track.id)
+    if stream is None:
+        stream = streams.setdefault(track.id, GrowingFile())
+    return stream
+
+
+def release_stream(track):
+    """
+    Forget the stream of a finished track. Readers already following it
+    keep their reference, later ones are served the finished file.
+    """
+    track.job.context.get('streams', {}).pop(track.id, None)
@@ -0,0 +1,355 @@
+"""
+Trace spans and structured, non-blocking logging.
+
+Every log record and finished span goes through a `QueueHandler`, so request
+and worker threads never wait on stdout or the disk. A `QueueListener` thread
+writes records as JSON lines to stdout and appends finished spans to an
+OTLP/JSON file (the format of the OpenTelemetry collector file exporter),
+which `python -m downtify.tracing` turns back into the critical path of a job.
+"""
+
+import argparse
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+logger = logging.getLogger('downtify')
+span_logger = logging.getLogger('downtify.trace')
+
+SERVICE_NAME = 'downtify'
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_current: contextvars.ContextVar['Span | None'] = contextvars.ContextVar(
+    'downtify_span', default=None
+)
+_listener: logging.handlers.QueueListener | None = None
+
+
+@dataclass(eq=False)
+class Span:
+    name: str
+    trace_id: str = field(default_factory=lambda: secrets.token_hex(16))
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    parent_id: str | None = None
+    attributes: dict = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    status: int = STATUS_UNSET
+    error: str | None = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return round((end - self.start_ns) / 1e6, 3)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.error = f'{error.__class__.__name__}: {error}'
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.status == STATUS_UNSET:
+            self.status = STATUS_OK
+        span_logger.info(
+            '%s finished in %sms',
+            self.name,
+            self.duration_ms,
+            extra={'span': self},
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'duration_ms': self.duration_ms,
+            'status': 'error' if self.status == STATUS_ERROR else 'ok',
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def start_span(name: str, parent: Span | None = None, **attributes) -> Span:
+    """
+    Start a span that must be ended explicitly. Without `parent` the span of
+    the calling context is used, or a new trace is started.
+    """
+    parent = parent or _current.get()
+    if parent is None:
+        return Span(name, attributes=attributes)
+    return Span(
+        name,
+        trace_id=parent.trace_id,
+        parent_id=parent.span_id,
+        attributes={**_inherited(parent), **attributes},
+    )
+
+
+def _inherited(parent: Span) -> dict:
+    # Job and track IDs are repeated on every child span for easy filtering
+    return {
+        key: value
+        for key, value in parent.attributes.items()
+        if key in {'job.id', 'track.id'}
+    }
+
+
+@contextmanager
+def span(name: str, parent: Span | None = None, **attributes):
+    """Run the block inside a new span that is current for its duration."""
+    current = start_span(name, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as error:
+        current.fail(error)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+class ContextFilter(logging.Filter):
+    """Tag log records with the trace, job and track of the current span."""
+
+    def filter(self, record):  # noqa: PLR6301
+        current = _current.get()
+        if current is not None and not hasattr(record, 'span'):
+            record.trace_id = current.trace_id
+            record.span_id = current.span_id
+            for key in ('job.id', 'track.id'):
+                if key in current.attributes:
+                    setattr(
+                        record, key.replace('.', '_'), current.attributes[key]
+                    )
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    FIELDS = ('trace_id', 'span_id', 'job_id', 'track_id')
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name in self.FIELDS:
+            if hasattr(record, name):
+                data[name] = getattr(record, name)
+        if hasattr(record, 'span'):
+            data['span'] = record.span.as_dict()
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans: list[Span]) -> dict:
+    """Encode spans as an OTLP/JSON `ExportTraceServiceRequest`."""
+    return {
+        'resourceSpans': [
+            {
+                'resource': {
+                    'attributes': [
+                        {
+                            'key': 'service.name',
+                            'value': {'stringValue': SERVICE_NAME},
+                        }
+                    ]
+                },
+                'scopeSpans': [
+                    {
+                        'scope': {'name': SERVICE_NAME},
+                        'spans': [
+                            {
+                                'traceId': s.trace_id,
+                                'spanId': s.span_id,
+                                'parentSpanId': s.parent_id or '',
+                                'name': s.name,
+                                'kind': 1,
+                                'startTimeUnixNano': str(s.start_ns),
+                                'endTimeUnixNano': str(s.end_ns),
+                                'attributes': [
+                                    {'key': key, 'value': _otlp_value(value)}
+                                    for key, value in s.attributes.items()
+                                ],
+                                'status': {
+                                    'code': s.status,
+                                    'message': s.error or '',
+                                },
+                            }
+                            for s in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class OTLPFileHandler(logging.handlers.RotatingFileHandler):
+    """Append every finished span to an OTLP/JSON lines file."""
+
+    def filter(self, record):
+        return hasattr(record, 'span') and super().filter(record)
+
+    def format(self, record):  # noqa: PLR6301
+        return json.dumps(to_otlp([record.span]))
+
+
+def setup_logging(
+    level: str = 'INFO',
+    trace_file: str | None = None,
+    trace_file_max_bytes: int = 50 * 1024 * 1024,
+):
+    """
+    Route the `downtify` loggers through a queue to a JSON stdout handler
+    and, when `trace_file` is given, to the OTLP span file.
+    """
+    global _listener  # noqa: PLW0603
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter())
+    stream.setLevel(level.upper())
+    handlers: list[logging.Handler] = [stream]
+    if trace_file:
+        os.makedirs(os.path.dirname(trace_file) or '.', exist_ok=True)
+        handlers.append(
+            OTLPFileHandler(
+                trace_file,
+                maxBytes=trace_file_max_bytes,
+                backupCount=3,
+                encoding='utf-8',
+            )
+        )
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    # Spans are recorded to the trace file whatever the log level
+    span_logger.setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(
+        records, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and detach the queue, call on shutdown."""
+    global _listener  # noqa: PLW0603
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logger.removeHandler(handler)
+    logger.propagate = True
+
+
+def read_spans(path: str) -> list[dict]:
+    spans = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            for resource in json.loads(line)['resourceSpans']:
+                for scope in resource['scopeSpans']:
+                    spans.extend(scope['spans'])
+    return spans
+
+
+def critical_path(spans: list[dict], root: dict) -> list[dict]:
+    """
+    Follow, from `root` down, the child that finished last: the chain of
+    spans that determined when the job was done.
+    """
+    children: dict[str, list[dict]] = {}
+    for item in spans:
+        children.setdefault(item['parentSpanId'], []).append(item)
+
+    path = [root]
+    while children.get(path[-1]['spanId']):
+        path.append(
+            max(
+                children[path[-1]['spanId']],
+                key=lambda s: int(s['endTimeUnixNano']),
+            )
+        )
+    return path
+
+
+def _attribute(item: dict, key: str):
+    for attribute in item['attributes']:
+        if attribute['key'] == key:
+            return next(iter(attribute['value'].values()))
+    return None
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description='Print the critical path of a download job'
+    )
+    parser.add_argument('trace_file')
+    parser.add_argument('job_id')
+    args = parser.parse_args(argv)
+
+    paths = [args.trace_file] + [
+        f'{args.trace_file}.{index}' for index in range(1, 4)
+    ]
+    spans = [s for p in paths if os.path.exists(p) for s in read_spans(p)]
+    job_spans = [s for s in spans if _attribute(s, 'job.id') == args.job_id]
+    roots = [
+        s
+        for s in job_spans
+        if s['parentSpanId'] not in {j['spanId'] for j in job_spans}
+    ]
+    if not roots:
+        parser.exit(1, f'No spans found for job {args.job_id}\n')
+
+    root = min(roots, key=lambda s: int(s['startTimeUnixNano']))
+    start = int(root['startTimeUnixNano'])
+    trace = [s for s in spans if s['traceId'] == root['traceId']]
+    for item in critical_path(trace, root):
+        offset = (int(item['startTimeUnixNano']) - start) / 1e6
+        duration = (
+            int(item['endTimeUnixNano']) - int(item['startTimeUnixNano'])
+        ) / 1e6
+        track = _attribute(item, 'song.name') or ''
+        print(f'{offset:>10.1f}ms {duration:>10.1f}ms  {item["name"]} {track}')
+
+
+if __name__ == '__main__':
+    main()
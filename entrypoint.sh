@@ -3,14 +3,14 @@
 echo "Setting umask to ${UMASK}"
 umask ${UMASK}
 echo "Creating download directory (${DOWNLOAD_DIR})"
-mkdir -p "${DOWNLOAD_DIR}" /.spotdl
+mkdir -p "${DOWNLOAD_DIR}" "${STATE_DIR}" /.spotdl
 
 if [ `id -u` -eq 0 ] && [ `id -g` -eq 0 ]; then
     if [ "${UID}" -eq 0 ]; then
         echo "Warning: it is not recommended to run as root user, please check your setting of the UID environment variable"
     fi
     echo "Changing ownership of download and state directories to ${UID}:${GID}"
-    chown -R "${UID}":"${GID}" /downtify /.spotdl "${DOWNLOAD_DIR}"
+    chown -R "${UID}":"${GID}" /downtify /.spotdl "${DOWNLOAD_DIR}" "${STATE_DIR}"
     echo "Running Downtify as user ${UID}:${GID}"
     su-exec "${UID}":"${GID}" uvicorn main:app --host 0.0.0.0 --port $DOWNTIFY_PORT
 else
@@ -1,20 +1,59 @@
+import asyncio
+import logging
+import mimetypes
 import os
+import random
+import threading
+import time
+from contextlib import contextmanager
 from functools import lru_cache
 
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi import Depends, FastAPI, Form, Header, HTTPException, Request
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field
 from spotdl import Spotdl
 from spotdl.types.options import DownloaderOptions
+from spotdl.utils.config import get_temp_path
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 import uvicorn
 
+from downtify import metrics
+from downtify.admission import AdmissionController, Saturated
+from downtify.assets import Assets, PrecompressedFiles
+from downtify.batch import BatchFeeder, parse_urls
+from downtify.concurrency import AIMDController
+from downtify.hedging import HedgedFetcher
+from downtify.match_cache import MatchCache
+from downtify.pipeline import Pipeline
+from downtify.profiling import Profiler, attached
+from downtify.resolver import bound_spotify_cache, iter_songs
+from downtify.scheduler import (
+    DONE,
+    FAILED,
+    QUEUED,
+    RUNNING,
+    Track,
+    TrackScheduler,
+    new_id,
+)
+from downtify.streaming import release_stream, stream_for
+from downtify.tracing import setup_logging, shutdown_logging, span, start_span
+
 load_dotenv()
 
+logger = logging.getLogger('downtify.app')
+
 DESCRIPTION = """
 Download Spotify music with album art and metadata.
 
@@ -26,6 +65,27 @@ class Message(BaseModel):
     message: str = Field(examples=['Download sucessful'])
 
 
+MAX_BATCH_URLS = int(os.getenv('MAX_BATCH_URLS', '500'))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+STREAM_START_TIMEOUT = float(os.getenv('STREAM_START_TIMEOUT', '30'))
+RESOLVE_WINDOW = int(os.getenv('RESOLVE_WINDOW', '100'))
+RESOLVE_PAGE_SIZE = int(os.getenv('RESOLVE_PAGE_SIZE', '100'))
+
+
+def parse_api_keys(value: str) -> dict[str, float]:
+    """`key:2,other` to the weight of every key, 1 when not given"""
+    keys = {}
+    for item in value.split(','):
+        key, _, weight = item.strip().partition(':')
+        if key:
+            keys[key] = float(weight or 1)
+    return keys
+
+
+API_KEYS = parse_api_keys(os.getenv('API_KEYS', ''))
+TRUST_PROXY = bool(os.getenv('TRUST_PROXY'))
+
+
 class SecurityMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         # Add security headers
@@ -45,8 +105,7 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
         
         # Add CSP header to prevent mixed content
-        csp = "default-src 'self'; script-src 'self' 'unsafe-inline' https://unpkg.com https://cdn.jsdelivr.net; style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; img-src 'self' data: https:; font-src 'self' https://cdnjs.cloudflare.com; connect-src 'self' https:;"
-        response.headers['Content-Security-Policy'] = csp
+        response.headers['Content-Security-Policy'] = CONTENT_SECURITY_POLICY
         
         return response
 
@@ -71,18 +130,72 @@ DOWNLOAD_DIR = os.getenv('DOWNLOAD_DIR', '/data/downloads')
 if not os.path.exists(DOWNLOAD_DIR):
     os.makedirs(DOWNLOAD_DIR)
 
+# Internal state (match cache, ...) lives outside the public downloads mount
+STATE_DIR = os.getenv('STATE_DIR', '/data/state')
+if not os.path.exists(STATE_DIR):
+    os.makedirs(STATE_DIR)
+
+setup_logging(
+    os.getenv('LOG_LEVEL', 'INFO'),
+    trace_file=os.getenv(
+        'TRACE_FILE', default=os.path.join(STATE_DIR, 'traces', 'spans.jsonl')
+    )
+    or None,
+)
+
 app.mount('/static', StaticFiles(directory='static'), name='static')
 app.mount('/assets', StaticFiles(directory='assets'), name='assets')
 
+# Fingerprinted assets from `python -m downtify.assets`, see downtify/assets.py
+ASSETS_DIR = os.getenv('ASSETS_DIR', 'dist')
+assets = Assets(ASSETS_DIR)
+if assets.manifest:
+    app.mount('/dist', PrecompressedFiles(directory=ASSETS_DIR), name='dist')
+
+
+def content_security_policy(assets: Assets) -> str:
+    """
+    Allow the CDNs only while the templates link to them, before the
+    assets are built; the templates still use inline style attributes.
+    """
+    if not assets.manifest:
+        return (
+            "default-src 'self'; "
+            "script-src 'self' 'unsafe-inline' https://unpkg.com "
+            "https://cdn.jsdelivr.net; "
+            "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net "
+            "https://cdnjs.cloudflare.com; "
+            "img-src 'self' data: https:; "
+            "font-src 'self' https://cdnjs.cloudflare.com; "
+            "connect-src 'self' https:;"
+        )
+    return (
+        "default-src 'self'; "
+        "script-src 'self'; "
+        "style-src 'self' 'unsafe-inline'; "
+        "img-src 'self' data: https:; "
+        "font-src 'self'; "
+        "connect-src 'self' https:;"
+    )
+
+
+CONTENT_SECURITY_POLICY = content_security_policy(assets)
+
 
 @app.on_event("startup")
 async def startup_event():
-    print("🚀 Downtify application starting up...")
-    print(f"📁 Download directory: {DOWNLOAD_DIR}")
-    print(f"🌐 Application will be available on port {os.getenv('PORT', '8000')}")
+    logger.info("🚀 Downtify application starting up...")
+    logger.info(f"📁 Download directory: {DOWNLOAD_DIR}")
+    logger.info(f"🌐 Application will be available on port {os.getenv('PORT', '8000')}")
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    shutdown_logging()
 
 app.mount('/downloads', StaticFiles(directory=DOWNLOAD_DIR), name='downloads')
 templates = Jinja2Templates(directory='templates')
+templates.env.globals['asset'] = assets.url
 
 DOWNLOADER_OPTIONS: DownloaderOptions = {
     'output': os.getenv(
@@ -99,7 +212,7 @@ DOWNLOADER_OPTIONS: DownloaderOptions = {
 
 @lru_cache(maxsize=1)
 def get_spotdl():
-    return Spotdl(
+    spotdlc = Spotdl(
         client_id=os.getenv(
             'CLIENT_ID', default='5f573c9620494bae87890c0f08a60293'
         ),
@@ -108,6 +221,185 @@ def get_spotdl():
         ),
         downloader_settings=DOWNLOADER_OPTIONS,
     )
+    bound_spotify_cache(int(os.getenv('SPOTIFY_CACHE_SIZE', '256')))
+    return spotdlc
+
+
+@lru_cache(maxsize=1)
+def get_match_cache() -> MatchCache:
+    return MatchCache(
+        os.path.join(STATE_DIR, 'matches.sqlite3'),
+        ttl=float(os.getenv('MATCH_CACHE_TTL_DAYS', '30')) * 24 * 3600,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_profiler() -> Profiler:
+    return Profiler(
+        os.path.join(STATE_DIR, 'profiles'),
+        interval=float(os.getenv('PROFILE_INTERVAL_MS', '10')) / 1000,
+        keep=int(os.getenv('PROFILE_KEEP', '50')),
+    )
+
+
+def should_profile(request: Request) -> bool:
+    """Profile on `X-Profile` header or `?profile=` flag, or by sample rate"""
+    flag = request.headers.get('x-profile') or request.query_params.get('profile')
+    if flag and flag.lower() not in {'0', 'false'}:
+        token = os.getenv('ADMIN_TOKEN')
+        return not token or request.headers.get('x-admin-token') == token
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profile_request(request: Request, name: str):
+    """Profile the calling thread and the jobs it waits on, when requested"""
+    if not should_profile(request):
+        yield None
+        return
+    with get_profiler().profile(f'{name}-{new_id()}') as profile:
+        yield profile
+
+
+@lru_cache(maxsize=1)
+def get_concurrency() -> AIMDController:
+    return AIMDController(
+        initial=DOWNLOADER_OPTIONS['threads'],
+        minimum=int(os.getenv('DOWNLOAD_CONCURRENCY_MIN', '1')),
+        maximum=int(os.getenv('DOWNLOAD_CONCURRENCY_MAX', '12')),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_fetcher() -> HedgedFetcher:
+    return HedgedFetcher(
+        get_temp_path(),
+        default_deadline=float(os.getenv('FIRST_BYTE_DEADLINE', '10')),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_pipeline() -> Pipeline:
+    return Pipeline(
+        get_spotdl().downloader,
+        get_match_cache(),
+        get_concurrency(),
+        get_fetcher(),
+    )
+
+
+def download_track(track: Track) -> str | None:
+    """Match, fetch, transcode and tag a track scheduled by the TrackScheduler"""
+    job = track.job
+    with (
+        attached(job.context.get('profile')),
+        span(
+            'track',
+            parent=job.context.get('span'),
+            **{'job.id': job.id, 'track.id': track.id},
+        ),
+    ):
+        try:
+            return str(get_pipeline().run(track.song, stream_for(track)))
+        finally:
+            release_stream(track)
+            get_admission().track_finished(time.monotonic() - track.started_at)
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> TrackScheduler:
+    limiter = get_concurrency()
+    return TrackScheduler(
+        download_track,
+        workers=limiter.maximum,
+        per_owner_limit=int(os.getenv('MAX_TRACKS_PER_USER', '0')) or None,
+        limiter=limiter,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_admission() -> AdmissionController:
+    return AdmissionController(
+        get_scheduler(),
+        max_requests=int(os.getenv('MAX_ACTIVE_REQUESTS', '32')),
+        max_queued_tracks=int(os.getenv('MAX_QUEUED_TRACKS', '1000')),
+    )
+
+
+def admitted():
+    """Hold an admission slot for the request, see `AdmissionController`"""
+    with get_admission().admit():
+        yield
+
+
+@app.exception_handler(Saturated)
+async def saturated_handler(request: Request, error: Saturated):
+    logger.warning(f"🚦 Rejected {request.url.path}: {error.reason}")
+    headers = {'Retry-After': str(error.retry_after)}
+    if request.url.path.startswith('/download-web'):
+        return HTMLResponse(f"""
+    <div>
+        <button type="submit" class="btn btn-lg btn-light fw-bold border-white button mx-auto" id="button-download" style="display: block;"><i class="fa-solid fa-down-long"></i></button>
+        <div class="alert alert-warning mx-auto" id="success-card" style="display: none;">
+            <strong>Downtify is busy right now. Please try again in {error.retry_after} seconds.</strong>
+        </div>
+    </div>
+    """, status_code=429, headers=headers)
+    return JSONResponse(
+        {'detail': f'Too busy ({error.reason}), retry in {error.retry_after}s'},
+        status_code=429,
+        headers=headers,
+    )
+
+
+def resolve(spotdlc: Spotdl, url: str, profile, root):
+    """The songs of `url` as they are resolved, for `submit_stream`"""
+    with attached(profile, 'resolve'), span('search', parent=root) as current:
+        count = 0
+        for song in iter_songs(spotdlc, url, RESOLVE_PAGE_SIZE):
+            count += 1
+            yield song
+        current.set(songs=count)
+
+
+def feed_batch(feeder: BatchFeeder, urls: list[str], profile, root):
+    """Resolve a batch into its job in the background, see `BatchFeeder`"""
+    error = None
+    try:
+        with attached(profile, 'resolve'), span('search', parent=root) as current:
+            count = feeder.feed(urls)
+            current.set(songs=count)
+        logger.info(f"📦 Batch job {feeder.job.id}: {count} unique song(s)")
+    except Exception as exception:
+        logger.exception(f"❌ Batch job {feeder.job.id} failed to resolve")
+        error = f'{exception.__class__.__name__}: {exception}'
+    finally:
+        # Ends the span and the profile once the queued tracks are done
+        feeder.scheduler.close(feeder.job, error)
+
+
+def get_submitter(request: Request) -> tuple[str, float]:
+    """
+    Identify who submitted a request, by API key or client IP, and return
+    it with its scheduling weight. Only keys listed in API_KEYS count, with
+    the weight given there, and X-Forwarded-For only behind a trusted
+    proxy, where its last hop is the address the proxy saw; anything else
+    a client can make up to get a fresh share of the scheduler.
+    """
+    api_key = request.headers.get('x-api-key')
+    if api_key and api_key in API_KEYS:
+        return f'key:{api_key}', API_KEYS[api_key]
+    forwarded = request.headers.get('x-forwarded-for')
+    if TRUST_PROXY and forwarded:
+        return f'ip:{forwarded.split(",")[-1].strip()}', 1.0
+    return f'ip:{request.client.host if request.client else "unknown"}', 1.0
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    """Protect admin endpoints with the ADMIN_TOKEN environment variable"""
+    token = os.getenv('ADMIN_TOKEN')
+    if token and x_admin_token != token:
+        raise HTTPException(status_code=403, detail='Invalid admin token')
 
 
 def validate_url(url: str) -> tuple[bool, str]:
@@ -157,9 +449,59 @@ def index(request: Request):
     tags=['Health'],
     summary='Health check endpoint',
 )
-def health_check():
-    """Health check endpoint for Railway monitoring"""
-    return {"status": "healthy", "service": "downtify"}
+def health_check(response: Response):
+    """
+    Health check endpoint for Railway monitoring. Answers `503` while new
+    downloads are being turned away, so a load balancer can route around
+    a busy instance.
+    """
+    saturation = get_admission().as_dict()
+    if saturation['saturated']:
+        response.status_code = 503
+    return {
+        "status": "saturated" if saturation['saturated'] else "healthy",
+        "service": "downtify",
+        "saturation": saturation,
+    }
+
+
+@app.get(
+    '/metrics',
+    tags=['Health'],
+    summary='Prometheus metrics',
+    response_class=PlainTextResponse,
+)
+def get_metrics(scheduler: TrackScheduler = Depends(get_scheduler)):
+    """Download concurrency and queue state in Prometheus text format"""
+    limiter = get_concurrency()
+    fetcher = get_fetcher()
+    admission = get_admission()
+    return metrics.render([
+        ('downtify_download_concurrency_limit', 'gauge', 'Concurrent downloads currently allowed', limiter.limit),
+        ('downtify_download_concurrency_min', 'gauge', 'Lower bound of the download limit', limiter.minimum),
+        ('downtify_download_concurrency_max', 'gauge', 'Upper bound of the download limit', limiter.maximum),
+        ('downtify_download_concurrency_increases_total', 'counter', 'Times the download limit was raised', limiter.increases),
+        ('downtify_download_concurrency_decreases_total', 'counter', 'Times the download limit was lowered', limiter.decreases),
+        ('downtify_fetch_throughput_bytes', 'gauge', 'Bytes per second fetched in the last round', limiter.throughput),
+        ('downtify_fetch_error_ratio', 'gauge', 'Share of failed fetches in the last round', limiter.error_rate),
+        ('downtify_fetch_seconds_per_mib', 'gauge', 'Median fetch time per MiB in the last round', limiter.latency),
+        ('downtify_tracks_running', 'gauge', 'Tracks being downloaded', scheduler.running),
+        ('downtify_tracks_queued', 'gauge', 'Tracks waiting for a download slot', scheduler.queued),
+        ('downtify_requests_active', 'gauge', 'Download requests being served', admission.active),
+        ('downtify_requests_max', 'gauge', 'Download requests served at once before shedding', admission.max_requests),
+        ('downtify_requests_rejected_total', 'counter', 'Download requests turned away with 429', admission.rejected),
+        ('downtify_saturated', 'gauge', 'Whether new download requests are turned away', int(admission.saturation() is not None)),
+        ('downtify_estimated_wait_seconds', 'gauge', 'Estimated time to finish the queued and running tracks', round(admission.estimated_wait(), 1)),
+        ('downtify_fetch_hedges_total', 'counter', 'Backup fetches started for slow or failed fetches', fetcher.hedges),
+        ('downtify_provider_circuit_open', 'gauge', 'Whether fetches to the provider are stopped', {
+            f'provider="{name}"': int(breaker.state != 'closed')
+            for name, breaker in fetcher.breakers.items()
+        }),
+        ('downtify_provider_first_byte_deadline_seconds', 'gauge', 'Time without data before a backup fetch starts', {
+            f'provider="{name}"': fetcher.deadline(name)
+            for name in fetcher.breakers
+        }),
+    ])
 
 
 @app.post(
@@ -167,9 +509,12 @@ def health_check():
     response_class=HTMLResponse,
     tags=['Downloader'],
     summary='Download one or more songs from a playlist via the WEB interface',
+    dependencies=[Depends(admitted)],
 )
 def download_web_ui(
+    request: Request,
     spotdlc: Spotdl = Depends(get_spotdl),
+    scheduler: TrackScheduler = Depends(get_scheduler),
     url: str = Form(...),
 ):
     """
@@ -180,6 +525,7 @@ def download_web_ui(
     ### Responses
 
     - `200` - Download successful.
+    - `429` - Too many downloads running, retry after `Retry-After` seconds.
     """
     try:
         # Validate URL first
@@ -194,10 +540,27 @@ def download_web_ui(
         </div>
         """
         
-        print(f"🔍 Searching for: {url}")
-        songs = spotdlc.search([url])
-        
-        if not songs:
+        logger.info(f"🔍 Searching for: {url}")
+        with (
+            profile_request(request, 'download-web') as profile,
+            span('download-web', url=url) as root,
+        ):
+            owner, weight = get_submitter(request)
+            job = scheduler.submit_stream(
+                owner,
+                resolve(spotdlc, url, profile, root),
+                window=RESOLVE_WINDOW,
+                weight=weight,
+                context={'profile': profile, 'span': root},
+            )
+            root.set(**{'job.id': job.id})
+            logger.info(f"📥 Job {job.id}: downloading tracks as they are found...")
+            job.wait()
+            root.set(**{'job.tracks': len(job.tracks)})
+
+        if job.error:
+            raise RuntimeError(job.error)
+        if not job.tracks:
             return f"""
         <div>
             <button type="submit" class="btn btn-lg btn-light fw-bold border-white button mx-auto" id="button-download" style="display: block;"><i class="fa-solid fa-down-long"></i></button>
@@ -207,12 +570,12 @@ def download_web_ui(
         </div>
         """
         
-        print(f"📥 Found {len(songs)} song(s), starting download...")
-        spotdlc.download_songs(songs)
-        print(f"✅ Download completed successfully!")
+        if job.status == FAILED:
+            raise RuntimeError(job.tracks[0].error)
+        logger.info("✅ Download completed successfully!")
         
     except Exception as error:
-        print(f"❌ Download error: {error}")
+        logger.error(f"❌ Download error: {error}")
         error_message = str(error)
         
         # Provide more helpful error messages
@@ -251,10 +614,13 @@ def download_web_ui(
     response_model=Message,
     tags=['Downloader'],
     summary='Download a song or songs from a playlist',
+    dependencies=[Depends(admitted)],
 )
 def download(
     url: str,
+    request: Request,
     spotdlc: Spotdl = Depends(get_spotdl),
+    scheduler: TrackScheduler = Depends(get_scheduler),
 ):
     """
     You can download a single song or all the songs in a playlist, album, etc.
@@ -264,15 +630,262 @@ def download(
     ### Responses
 
     - `200` - Download successful.
+    - `429` - Too many downloads running, retry after `Retry-After` seconds.
     """
     try:
-        songs = spotdlc.search([url])
-        spotdlc.download_songs(songs)
+        with (
+            profile_request(request, 'download') as profile,
+            span('download', url=url) as root,
+        ):
+            owner, weight = get_submitter(request)
+            job = scheduler.submit_stream(
+                owner,
+                resolve(spotdlc, url, profile, root),
+                window=RESOLVE_WINDOW,
+                weight=weight,
+                context={'profile': profile, 'span': root},
+            )
+            root.set(**{'job.id': job.id})
+            job.wait()
+            root.set(**{'job.tracks': len(job.tracks)})
+        if job.error:
+            raise RuntimeError(job.error)
         return {'message': 'Download sucessful'}
     except Exception as error:  # pragma: no cover
         return {'detail': error}
 
 
+@app.post(
+    '/download/batch',
+    response_class=JSONResponse,
+    tags=['Downloader'],
+    summary='Download the songs of many URLs as a single job',
+    dependencies=[Depends(admitted)],
+)
+async def download_batch(
+    request: Request,
+    spotdlc: Spotdl = Depends(get_spotdl),
+    scheduler: TrackScheduler = Depends(get_scheduler),
+):
+    """
+    Submit many URLs at once, as a JSON list, a `{"urls": [...]}` object or
+    one URL per line. All URLs are resolved concurrently and tracks shared
+    between them are downloaded only once.
+
+    The job is created right away and tracks are added to it and downloaded
+    as they are resolved, poll `/jobs/{job_id}` for the status of every URL
+    and track.
+
+    ### Responses
+
+    - `200` - Job created.
+    - `400` - Invalid body or too many URLs.
+    - `429` - Too many downloads running, retry after `Retry-After` seconds.
+    """
+    try:
+        urls = parse_urls(
+            await request.body(), request.headers.get('content-type', '')
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    if not urls:
+        raise HTTPException(status_code=400, detail='No URLs provided')
+    if len(urls) > MAX_BATCH_URLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f'Too many URLs, the limit is {MAX_BATCH_URLS}',
+        )
+
+    invalid = {url: validate_url(url) for url in urls}
+    invalid = {url: message for url, (ok, message) in invalid.items() if not ok}
+
+    # The job outlives the request, so the span and the profile end with it
+    profiler = get_profiler() if should_profile(request) else None
+    profile = profiler.start(f'download-batch-{new_id()}') if profiler else None
+    root = start_span('download-batch', urls=len(urls))
+
+    owner, weight = get_submitter(request)
+    job = scheduler.open_job(
+        owner, weight, context={'profile': profile, 'span': root}
+    )
+    root.set(**{'job.id': job.id})
+    job.add_done_callback(lambda job: root.set(**{'job.tracks': len(job.tracks)}))
+    job.add_done_callback(lambda _: root.end())
+    if profile is not None:
+        job.add_done_callback(lambda _: profiler.stop(profile))
+    for url in urls:
+        job.add_source(url, [], invalid.get(url), resolving=url not in invalid)
+
+    feeder = BatchFeeder(
+        scheduler, job, lambda url: iter_songs(spotdlc, url, RESOLVE_PAGE_SIZE)
+    )
+    feeder.threads = DOWNLOADER_OPTIONS['threads'] * 2
+    feeder.window = RESOLVE_WINDOW
+    try:
+        threading.Thread(
+            target=feed_batch,
+            args=(feeder, [url for url in urls if url not in invalid], profile, root),
+            name=f'downtify-batch-{job.id}',
+            daemon=True,
+        ).start()
+    except BaseException:
+        scheduler.close(job, 'Could not start resolving the batch')
+        raise
+
+    logger.info(f"📦 Batch job {job.id}: {len(urls)} URL(s), resolving in the background")
+    return job.as_dict()
+
+
+@app.get(
+    '/jobs/{job_id}',
+    response_class=JSONResponse,
+    tags=['Downloader'],
+    summary='Status of a download job',
+)
+def job_status(
+    job_id: str,
+    scheduler: TrackScheduler = Depends(get_scheduler),
+):
+    """Per-URL and per-track status of a job created by `/download/batch`"""
+    job = scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return job.as_dict()
+
+
+@app.get(
+    '/stream/{job_id}/{track_id}',
+    tags=['Downloader'],
+    summary='Listen to a track while it is downloading',
+)
+async def stream_track(
+    job_id: str,
+    track_id: str,
+    scheduler: TrackScheduler = Depends(get_scheduler),
+):
+    """
+    Stream the audio of a track from `/jobs/{job_id}` as soon as conversion
+    starts, instead of waiting for the whole track. A finished track is
+    served from its file.
+
+    ### Responses
+
+    - `200` - Audio, complete when the track is finished.
+    - `404` - Unknown job or track.
+    - `409` - The track failed.
+    - `503` - The track has not started converting yet, retry later.
+    """
+    job = scheduler.get(job_id)
+    track = next((t for t in job.tracks if t.id == track_id), None) if job else None
+    if track is None:
+        raise HTTPException(status_code=404, detail='Track not found')
+
+    media_type = mimetypes.guess_type(f"track.{DOWNLOADER_OPTIONS['format']}")[0] or 'application/octet-stream'
+    stream = None
+    if track.status in {QUEUED, RUNNING}:
+        stream = stream_for(track)
+        deadline = time.monotonic() + STREAM_START_TIMEOUT
+        while (
+            not stream.wait_started(0)
+            and track.status in {QUEUED, RUNNING}
+            and time.monotonic() < deadline
+        ):
+            await asyncio.sleep(0.25)
+        if track.status not in {QUEUED, RUNNING}:
+            # Finished while waiting, the stream may have been created after
+            # the worker released it
+            release_stream(track)
+
+    if track.status == FAILED or (stream and stream.error):
+        raise HTTPException(status_code=409, detail=track.error or stream.error)
+    if track.status == DONE:
+        if not (track.path and os.path.exists(track.path)):
+            raise HTTPException(status_code=404, detail='File not found')
+        return FileResponse(track.path, media_type=media_type)
+    if not stream.wait_started(0):
+        raise HTTPException(
+            status_code=503,
+            detail='Track has not started converting yet',
+            headers={'Retry-After': '10'},
+        )
+
+    return StreamingResponse(
+        stream.follow(),
+        media_type=media_type,
+        headers={'Cache-Control': 'no-store'},
+    )
+
+
+@app.get(
+    '/admin/matches/{song_id}',
+    tags=['Admin'],
+    summary='Cached audio provider match of a Spotify track',
+    dependencies=[Depends(require_admin)],
+)
+def get_match(
+    song_id: str,
+    match_cache: MatchCache = Depends(get_match_cache),
+):
+    match = match_cache.get(song_id)
+    if match is None:
+        raise HTTPException(status_code=404, detail='Match not found')
+    return match.as_dict()
+
+
+@app.delete(
+    '/admin/matches/{song_id}',
+    tags=['Admin'],
+    summary='Invalidate the cached match of a Spotify track',
+    dependencies=[Depends(require_admin)],
+)
+def invalidate_match(
+    song_id: str,
+    match_cache: MatchCache = Depends(get_match_cache),
+):
+    return {'invalidated': match_cache.invalidate(song_id)}
+
+
+@app.delete(
+    '/admin/matches',
+    tags=['Admin'],
+    summary='Invalidate every cached match',
+    dependencies=[Depends(require_admin)],
+)
+def invalidate_matches(match_cache: MatchCache = Depends(get_match_cache)):
+    return {'invalidated': match_cache.invalidate()}
+
+
+@app.get(
+    '/admin/profiles',
+    tags=['Admin'],
+    summary='List captured profiles',
+    dependencies=[Depends(require_admin)],
+)
+def list_profiles(profiler: Profiler = Depends(get_profiler)):
+    """
+    Profiles are captured for requests sent with an `X-Profile: 1` header or
+    a `?profile=1` query flag, and for a `PROFILE_SAMPLE_RATE` fraction of
+    all download requests. Open the `.speedscope.json` files in
+    https://www.speedscope.app or feed the `.collapsed.txt` files to a
+    flamegraph tool.
+    """
+    return profiler.list()
+
+
+@app.get(
+    '/admin/profiles/{filename}',
+    tags=['Admin'],
+    summary='Download a captured profile',
+    dependencies=[Depends(require_admin)],
+)
+def get_profile(filename: str, profiler: Profiler = Depends(get_profiler)):
+    path = profiler.path(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail='Profile not found')
+    return FileResponse(path, filename=filename)
+
+
 @app.get(
     '/list',
     response_class=HTMLResponse,
@@ -332,24 +945,23 @@ if __name__ == "__main__":
         try:
             port = int(port_str)
         except ValueError:
-            print(f"Warning: Invalid PORT value '{port_str}', using default port 8000")
+            logger.warning(f"Invalid PORT value '{port_str}', using default port 8000")
             port = 8000
         
-        print(f"Starting Downtify on port {port}")
-        print(f"Download directory: {DOWNLOAD_DIR}")
-        print(f"Static files mounted at: /static, /assets, /downloads")
-        print(f"Health check available at: /health")
+        logger.info(f"Starting Downtify on port {port}")
+        logger.info(f"Download directory: {DOWNLOAD_DIR}")
+        logger.info(f"Static files mounted at: /static, /assets, /downloads")
+        logger.info(f"Health check available at: /health")
         
         # Test if directories exist
-        print(f"Checking directories...")
-        print(f"Static directory exists: {os.path.exists('static')}")
-        print(f"Templates directory exists: {os.path.exists('templates')}")
-        print(f"Assets directory exists: {os.path.exists('assets')}")
-        print(f"Download directory exists: {os.path.exists(DOWNLOAD_DIR)}")
+        logger.info(f"Checking directories...")
+        logger.info(f"Static directory exists: {os.path.exists('static')}")
+        logger.info(f"Templates directory exists: {os.path.exists('templates')}")
+        logger.info(f"Assets directory exists: {os.path.exists('assets')}")
+        logger.info(f"Download directory exists: {os.path.exists(DOWNLOAD_DIR)}")
         
         uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
     except Exception as e:
-        print(f"❌ Failed to start application: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Failed to start application: {e}")
+        shutdown_logging()
         exit(1)
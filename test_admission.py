@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Test script to verify admission control and load shedding
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from downtify.admission import AdmissionController, Saturated
+from downtify.scheduler import TrackScheduler
+
+
+def make_controller(**options):
+    gate = threading.Event()
+    scheduler = TrackScheduler(lambda track: gate.wait(5) and '/tmp/x', 2)
+    return AdmissionController(scheduler, **options), scheduler, gate
+
+
+def test_request_limit():
+    """Requests beyond the limit are rejected until a slot frees up"""
+    print('Testing concurrent request limit...')
+
+    controller, _, _ = make_controller(max_requests=2)
+    with controller.admit(), controller.admit():
+        assert controller.active == 2
+        try:
+            with controller.admit():
+                raise AssertionError('third request was admitted')
+        except Saturated as error:
+            reason = error.reason
+        assert reason == '2 download requests running', reason
+
+    with controller.admit():
+        assert controller.active == 1
+    assert controller.rejected == 1
+    print('✅ Third request rejected, admitted again once a slot was free')
+    return True
+
+
+def test_queue_limit_and_retry_after():
+    """A long track queue sheds requests with a backlog based estimate"""
+    print('\nTesting queue limit and Retry-After estimate...')
+
+    controller, scheduler, gate = make_controller(
+        max_queued_tracks=5, track_seconds=10
+    )
+    job = scheduler.submit('ip:1', list(range(4)))
+    job2 = scheduler.submit('ip:2', list(range(6)))
+    try:
+        retry_after = None
+        try:
+            with controller.admit():
+                pass
+        except Saturated as error:
+            retry_after = error.retry_after
+        # 10 tracks over 2 slots at 10 seconds each
+        assert retry_after == 50, retry_after
+        assert controller.as_dict()['saturated']
+    finally:
+        gate.set()
+    assert job.wait(5)
+    assert job2.wait(5)
+    assert not controller.as_dict()['saturated']
+
+    controller.track_finished(20)
+    assert controller.track_seconds == 11, controller.track_seconds
+    print(f'✅ Rejected with Retry-After: {retry_after}')
+    return True
+
+
+def test_endpoints_shed_load():
+    """Download endpoints answer 429 and /health 503 while saturated"""
+    print('\nTesting 429 responses and /health...')
+
+    os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp())
+    os.environ.setdefault('STATE_DIR', tempfile.mkdtemp())
+    from fastapi.testclient import TestClient
+
+    import main
+
+    client = TestClient(main.app)
+    admission = main.get_admission()
+    limit = admission.max_requests
+    admission.max_requests = 0
+    try:
+        url = 'https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC'
+        response = client.post('/download/', params={'url': url})
+        assert response.status_code == 429, response.status_code
+        assert int(response.headers['retry-after']) >= 1
+
+        response = client.post('/download-web/', data={'url': url})
+        assert response.status_code == 429
+        assert 'try again in' in response.text
+
+        health = client.get('/health')
+        assert health.status_code == 503
+        assert health.json()['status'] == 'saturated'
+    finally:
+        admission.max_requests = limit
+
+    health = client.get('/health')
+    assert health.status_code == 200
+    assert health.json()['saturation']['saturated'] is False
+    print('✅ Saturated node sheds requests and reports it on /health')
+    return True
+
+
+def test_batch_stays_within_window():
+    """A large batch queues at most a window of tracks at a time"""
+    print('\nTesting the queue while a large batch resolves...')
+
+    os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp())
+    os.environ.setdefault('STATE_DIR', tempfile.mkdtemp())
+    from types import SimpleNamespace
+
+    from fastapi.testclient import TestClient
+
+    import main
+
+    def iter_songs(spotdlc, url, page_size):
+        for index in range(3000):
+            yield SimpleNamespace(
+                url=f'{url}/{index}', download_url=None, display_name=index
+            )
+
+    gate = threading.Event()
+    scheduler = TrackScheduler(lambda track: gate.wait(5) and '/tmp/x', 2)
+    admission = main.get_admission()
+    saved = admission.scheduler, admission.max_queued_tracks
+    original = main.iter_songs
+    admission.scheduler = scheduler
+    admission.max_queued_tracks = 5 * main.RESOLVE_WINDOW
+    main.iter_songs = iter_songs
+    main.app.dependency_overrides[main.get_scheduler] = lambda: scheduler
+    main.app.dependency_overrides[main.get_spotdl] = lambda: None
+    try:
+        client = TestClient(main.app)
+        playlist = 'https://open.spotify.com/playlist/large'
+        job = scheduler.get(
+            client.post('/download/batch', json=[playlist]).json()['id']
+        )
+        deadline = time.monotonic() + 5
+        while (
+            scheduler.queued < main.RESOLVE_WINDOW
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+        time.sleep(0.1)
+        queued = scheduler.queued
+        assert queued == main.RESOLVE_WINDOW, f'{queued} tracks queued'
+
+        other = client.post('/download/batch', json=[f'{playlist}-2'])
+        assert other.status_code == 200, other.status_code
+    finally:
+        gate.set()
+        admission.scheduler, admission.max_queued_tracks = saved
+        main.iter_songs = original
+        main.app.dependency_overrides.clear()
+
+    assert job.wait(10), 'batch job did not finish'
+    assert len(job.tracks) == 3000
+    print(
+        f'✅ {queued} of 3000 tracks queued at once, other requests admitted'
+    )
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🚦 Testing Admission Control for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_request_limit,
+        test_queue_limit_and_retry_after,
+        test_endpoints_shed_load,
+        test_batch_stays_within_window,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Test script to verify fingerprinted, precompressed static assets
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from downtify import assets
+
+FONT_CSS = (
+    b'@font-face{src:url(../webfonts/fa-solid-900.woff2) format("woff2"),'
+    b'url("../webfonts/fa-solid-900.ttf") format("truetype")}'
+    b'.x{background:url(data:image/png;base64,AAAA)}'
+    b'/*# sourceMappingURL=all.min.css.map */'
+)
+
+
+def fake_fetch(fetched):
+    """Serve every asset from memory, recording what was fetched"""
+
+    def fetch(source):
+        fetched.append(source)
+        if source == assets.VENDORED['font-awesome.min.css']:
+            return FONT_CSS
+        if source.startswith('https://'):
+            return f'/* {source} */ body{{color:red}}'.encode() * 50
+        return Path(source).read_bytes()
+
+    return fetch
+
+
+def build():
+    output = Path(tempfile.mkdtemp())
+    fetched = []
+    manifest = assets.build(output, fake_fetch(fetched))
+    return output, manifest, fetched
+
+
+def test_build():
+    """Assets get hashed names, gzip copies and vendored fonts"""
+    print('Testing the asset build...')
+
+    output, manifest, fetched = build()
+    assert set(manifest) == set(assets.VENDORED) | set(assets.LOCAL)
+    htmx = manifest['htmx.min.js']
+    assert htmx.startswith('htmx.min.'), htmx
+    assert htmx.endswith('.js'), htmx
+    assert (output / assets.MANIFEST).exists()
+
+    compressed = (output / f'{htmx}.gz').read_bytes()
+    assert gzip.decompress(compressed) == (output / htmx).read_bytes()
+    png = manifest['favicon-32x32.png']
+    assert not (output / f'{png}.gz').exists(), 'png was compressed'
+
+    css = (output / manifest['font-awesome.min.css']).read_text()
+    assert 'webfonts' not in css, css
+    assert 'sourceMappingURL' not in css
+    assert 'url(data:image/png;base64,AAAA)' in css
+    font = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/'
+    assert f'{font}webfonts/fa-solid-900.woff2' in fetched, fetched
+    assert len(fetched) == len(manifest) + 2
+    print(f'✅ {len(fetched)} assets vendored, htmx as {htmx}')
+    return True
+
+
+def test_precompressed_response():
+    """The compressed copy is served with an immutable cache header"""
+    print('\nTesting precompressed responses...')
+
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    output, manifest, _ = build()
+    app = FastAPI()
+    app.mount('/dist', assets.PrecompressedFiles(directory=output))
+    client = TestClient(app)
+    url = f'/dist/{manifest["bootstrap.min.css"]}'
+
+    response = client.get(url, headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['content-type'].startswith('text/css')
+    assert response.headers['cache-control'] == assets.IMMUTABLE
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.content.startswith(b'/* https://'), response.content[:20]
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in plain.headers
+    assert plain.content == response.content
+
+    refused = client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'content-encoding' not in refused.headers
+
+    cached = client.get(
+        url, headers={'If-None-Match': response.headers['etag']}
+    )
+    assert cached.status_code == 304, cached.status_code
+    print(f'✅ Served {url} gzipped and immutable')
+    return True
+
+
+def test_template_urls():
+    """Templates use hashed names once built, the CDNs before that"""
+    print('\nTesting asset URLs in templates...')
+
+    output, manifest, _ = build()
+    built = assets.Assets(str(output))
+    assert built.url('htmx.min.js') == f'/dist/{manifest["htmx.min.js"]}'
+
+    unbuilt = assets.Assets(tempfile.mkdtemp())
+    assert unbuilt.url('htmx.min.js') == assets.VENDORED['htmx.min.js']
+    assert unbuilt.url('style.css') == '/static/css/style.css'
+
+    os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp())
+    os.environ.setdefault('STATE_DIR', tempfile.mkdtemp())
+    from fastapi.testclient import TestClient
+
+    import main
+
+    page = TestClient(main.app).get('/').text
+    assert main.assets.url('bootstrap.min.css') in page
+    assert main.assets.url('script.js') in page
+    print('✅ Templates link to the built or CDN assets')
+    return True
+
+
+def test_content_security_policy():
+    """The CDNs are allowed only until the assets are built"""
+    print('\nTesting the content security policy...')
+
+    os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp())
+    os.environ.setdefault('STATE_DIR', tempfile.mkdtemp())
+    from fastapi.testclient import TestClient
+
+    import main
+
+    output, _, _ = build()
+    built = main.content_security_policy(assets.Assets(str(output)))
+    unbuilt = main.content_security_policy(assets.Assets(tempfile.mkdtemp()))
+
+    cdns = ['unpkg.com', 'cdn.jsdelivr.net', 'cdnjs.cloudflare.com']
+    for cdn in cdns:
+        assert cdn in unbuilt, cdn
+        assert cdn not in built, cdn
+    directives = dict(
+        directive.strip().split(' ', 1)
+        for directive in built.split(';')
+        if directive.strip()
+    )
+    assert directives['script-src'] == "'self'", directives
+    assert directives['style-src'] == "'self' 'unsafe-inline'", directives
+    assert directives['font-src'] == "'self'", directives
+
+    response = TestClient(main.app).get('/')
+    policy = response.headers['content-security-policy']
+    assert policy == main.content_security_policy(main.assets), policy
+    print(f'✅ Built assets are served under {directives["script-src"]}')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('📦 Testing Static Assets for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_build,
+        test_precompressed_response,
+        test_template_urls,
+        test_content_security_policy,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
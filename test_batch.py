@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the bulk submission helpers of Downtify
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from downtify import batch
+from downtify.scheduler import TrackScheduler
+
+
+def test_parse_urls():
+    """JSON and newline-delimited bodies are both accepted"""
+    print('Testing URL parsing...')
+
+    urls = ['https://open.spotify.com/track/a', 'https://youtu.be/b']
+    as_json = batch.parse_urls(
+        b'{"urls": ["%s", "%s"]}' % tuple(url.encode() for url in urls)
+    )
+    as_list = batch.parse_urls(
+        ('["%s", "%s", "%s"]' % (*urls, urls[0])).encode(), 'application/json'
+    )
+    as_text = batch.parse_urls(
+        f'{urls[0]}\n\n# comment\n{urls[1]}\n{urls[0]}\n'.encode()
+    )
+
+    assert as_json == urls, as_json
+    assert as_list == urls, as_list
+    assert as_text == urls, as_text
+    print('✅ JSON, JSON object and newline bodies parse to the same URLs')
+
+    try:
+        batch.parse_urls(b'{"urls": "nope"}')
+    except ValueError:
+        print('✅ Invalid JSON payload is rejected')
+    else:
+        raise AssertionError('invalid payload was accepted')
+    return True
+
+
+def song(url):
+    return SimpleNamespace(url=url, download_url=None, display_name=url)
+
+
+def test_feeder_deduplicates():
+    """Tracks shared between URLs are queued only once"""
+    print('\nTesting batched resolution...')
+
+    playlists = {
+        'playlist-1': [song('t1'), song('t2'), song('t1')],
+        'playlist-2': [song('t2'), song('t3')],
+    }
+
+    def expand(url):
+        yield from playlists.get(url, [])
+        if url == 'broken':
+            raise LookupError('not found')
+
+    scheduler = TrackScheduler(lambda track: '/tmp/x', 2)
+    job = scheduler.open_job('ip:1')
+    feeder = batch.BatchFeeder(scheduler, job, expand)
+    count = feeder.feed(['playlist-1', 'playlist-2', 'broken'])
+    scheduler.close(job)
+
+    assert job.wait(5), 'batch job did not finish'
+    assert count == 3, count
+    assert sorted(track.name for track in job.tracks) == ['t1', 't2', 't3']
+    sources = {source['url']: source for source in job.as_dict()['sources']}
+    names = {track.id: track.name for track in job.tracks}
+    assert [names[t] for t in sources['playlist-2']['tracks']] == ['t2', 't3']
+    assert len(sources['playlist-1']['tracks']) == 2
+    assert sources['broken']['error'] == 'not found'
+    assert sources['broken']['status'] == 'failed'
+    print('✅ Shared tracks are queued once and errors are kept per URL')
+    return True
+
+
+def test_source_status_while_resolving():
+    """A URL is not done while it may still get more tracks"""
+    print('\nTesting the status of a URL being resolved...')
+
+    gate = threading.Event()
+
+    def expand(url):
+        yield song('t1')
+        gate.wait(5)
+        yield song('t2')
+
+    scheduler = TrackScheduler(lambda track: '/tmp/x', 2)
+    job = scheduler.open_job('ip:1')
+    feeder = batch.BatchFeeder(scheduler, job, expand)
+    thread = threading.Thread(target=feeder.feed, args=(['playlist'],))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while job.finished < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    status = job.as_dict()['sources'][0]['status']
+    assert job.finished == 1, 'first track did not finish'
+    assert status == 'running', status
+
+    gate.set()
+    thread.join(5)
+    scheduler.close(job)
+    assert job.wait(5), 'batch job did not finish'
+    status = job.as_dict()['sources'][0]['status']
+    assert status == 'done', status
+    print('✅ Running while paging, done once resolved and downloaded')
+    return True
+
+
+def test_batch_responds_before_resolving():
+    """The batch job is returned while its URLs are still being resolved"""
+    print('\nTesting background resolution of a batch...')
+
+    os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp())
+    os.environ.setdefault('STATE_DIR', tempfile.mkdtemp())
+    from fastapi.testclient import TestClient
+
+    import main
+
+    gate = threading.Event()
+
+    def iter_songs(spotdlc, url, page_size):
+        gate.wait(5)
+        if url.endswith('broken'):
+            raise LookupError('not found')
+        yield song(url)
+
+    scheduler = TrackScheduler(lambda track: '/tmp/x', 2)
+    main.app.dependency_overrides[main.get_scheduler] = lambda: scheduler
+    main.app.dependency_overrides[main.get_spotdl] = lambda: None
+    original = main.iter_songs
+    main.iter_songs = iter_songs
+    try:
+        track = 'https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC'
+        response = TestClient(main.app).post(
+            '/download/batch',
+            json=[track, 'https://open.spotify.com/playlist/broken'],
+        )
+        data = response.json()
+        assert response.status_code == 200, data
+        assert data['feeding'], data
+        assert data['status'] == 'queued', data
+        statuses = [source['status'] for source in data['sources']]
+        assert statuses == ['queued', 'queued'], statuses
+        job = scheduler.get(data['id'])
+        root = job.context['span']
+
+        gate.set()
+        assert job.wait(5), 'batch job did not finish'
+    finally:
+        main.iter_songs = original
+        main.app.dependency_overrides.clear()
+
+    assert root.end_ns is not None, 'span was not ended'
+    assert [track.name for track in job.tracks] == [track]
+    sources = job.as_dict()['sources']
+    assert [source['status'] for source in sources] == ['done', 'failed']
+    assert sources[1]['error'] == 'not found'
+    print(f'✅ Job {job.id} answered before resolving, span ended with it')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('📦 Testing Bulk Submission for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_parse_urls,
+        test_feeder_deduplicates,
+        test_source_status_while_resolving,
+        test_batch_responds_before_resolving,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the adaptive download concurrency controller
+"""
+
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from downtify import concurrency
+from downtify.concurrency import MIB, AIMDController
+from downtify.scheduler import TrackScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_round(controller, clock, seconds_per_mib=1.0, errors=0):
+    """Finish one round of `limit` 4 MiB fetches that ran side by side"""
+    started = clock.now
+    clock.now += 4 * seconds_per_mib
+    count = controller.limit
+    for index in range(count):
+        controller.throttled()
+        controller.record(started, 4 * MIB, error=index < errors)
+    clock.now += 0.1
+
+
+def with_clock(test):
+    def wrapper():
+        clock = Clock()
+        original = concurrency.time
+        concurrency.time = SimpleNamespace(monotonic=clock)
+        try:
+            return test(clock)
+        finally:
+            concurrency.time = original
+
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@with_clock
+def test_additive_increase(clock):
+    """A healthy, throttled round adds one download up to the maximum"""
+    print('Testing additive increase...')
+
+    controller = AIMDController(initial=2, maximum=4)
+    limits = []
+    for _ in range(6):
+        run_round(controller, clock)
+        limits.append(controller.limit)
+
+    assert limits[0] == 3, limits
+    assert max(limits) == 4, limits
+    assert controller.limit <= controller.maximum
+    print(f'✅ Limit grew as {limits}')
+    return True
+
+
+@with_clock
+def test_no_increase_without_demand(clock):
+    """The limit stays put when nothing waits for a download slot"""
+    print('\nTesting no increase without queued work...')
+
+    controller = AIMDController(initial=2)
+    for _ in range(3):
+        started = clock.now
+        clock.now += 4
+        controller.record(started, 4 * MIB)
+        controller.record(started, 4 * MIB)
+        clock.now += 0.1
+
+    assert controller.limit == 2, controller.limit
+    print('✅ Limit unchanged while idle')
+    return True
+
+
+@with_clock
+def test_decrease_on_errors(clock):
+    """A round with many failed fetches halves the limit"""
+    print('\nTesting multiplicative decrease on errors...')
+
+    controller = AIMDController(initial=8, minimum=3)
+    run_round(controller, clock, errors=4)
+    assert controller.limit == 4, controller.limit
+    assert controller.decreases == 1
+
+    run_round(controller, clock, errors=4)
+    assert controller.limit == 3, 'limit went below the minimum'
+    print(f'✅ Limit backed off to {controller.limit}')
+    return True
+
+
+@with_clock
+def test_decrease_on_latency(clock):
+    """Fetches much slower than the best round halve the limit"""
+    print('\nTesting multiplicative decrease on latency...')
+
+    controller = AIMDController(initial=4, maximum=4)
+    run_round(controller, clock, seconds_per_mib=1.0)
+    run_round(controller, clock, seconds_per_mib=3.0)
+    assert controller.limit == 2, controller.limit
+    assert controller.latency == 3.0, controller.latency
+    print(f'✅ Latency {controller.latency}s/MiB lowered limit to 2')
+    return True
+
+
+@with_clock
+def test_stale_samples_ignored(clock):
+    """Fetches started before a change do not count towards the next"""
+    print('\nTesting fetches from before a change are ignored...')
+
+    controller = AIMDController(initial=4)
+    before = clock.now
+    run_round(controller, clock, errors=4)
+    assert controller.limit == 2
+    for _ in range(4):
+        controller.record(before, error=True)
+    assert controller.limit == 2, 'stale failures lowered the limit again'
+    print('✅ Stale failures ignored')
+    return True
+
+
+def test_scheduler_follows_limit():
+    """The scheduler runs as many tracks as the controller allows"""
+    print('\nTesting scheduler follows the controller limit...')
+
+    gate = threading.Event()
+    controller = AIMDController(initial=2, maximum=6)
+    scheduler = TrackScheduler(
+        lambda track: gate.wait(5) and '/tmp/x.mp3',
+        workers=controller.maximum,
+        limiter=controller,
+    )
+    job = scheduler.submit('ip:1', list(range(2)))
+    job2 = scheduler.submit('ip:2', list(range(4)))
+    time.sleep(0.2)
+    assert scheduler.running == 2, scheduler.running
+    assert controller._throttled, 'waiting tracks were not reported'
+
+    controller.limit = 5
+    gate.set()
+    assert job.wait(5)
+    assert job2.wait(5)
+    print('✅ Scheduler capped at the controller limit')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('📶 Testing Adaptive Concurrency for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_additive_increase,
+        test_no_increase_without_demand,
+        test_decrease_on_errors,
+        test_decrease_on_latency,
+        test_stale_samples_ignored,
+        test_scheduler_follows_limit,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Test script to verify hedged fetching and provider circuit breakers
+"""
+
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from spotdl.providers.audio.base import AudioProviderError
+
+from downtify import tracing
+from downtify.hedging import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    HedgedFetcher,
+    candidates,
+)
+from downtify.profiling import Profiler, attached
+
+YTM = 'https://music.youtube.com/watch?v=aaa'
+YT = 'https://www.youtube.com/watch?v=aaa'
+RUNNER_UP = 'https://music.youtube.com/watch?v=bbb'
+
+
+def fake_download(delays, failing=()):
+    """Download that waits `delays[url]` seconds before the first byte"""
+
+    def download(url, directory, progress_hook):
+        deadline = time.monotonic() + delays.get(url, 0)
+        while time.monotonic() < deadline:
+            progress_hook({'status': 'downloading', 'downloaded_bytes': 0})
+            time.sleep(0.01)
+        if url in failing:
+            raise AudioProviderError(f'YT-DLP download error - {url}')
+        progress_hook({'status': 'downloading', 'downloaded_bytes': 1})
+        path = Path(directory) / 'audio.webm'
+        path.write_bytes(b'audio')
+        return path, {'id': url[-3:], 'ext': 'webm'}
+
+    return download
+
+
+def test_candidates():
+    """YouTube Music matches are followed by the same video on YouTube"""
+    print('Testing candidate list...')
+
+    urls = candidates([YTM, RUNNER_UP, YTM])
+    assert urls == [YTM, YT, RUNNER_UP], urls
+    assert candidates([YT]) == [YT]
+    print(f'✅ Candidates: {urls}')
+    return True
+
+
+def test_circuit_breaker():
+    """A failing provider is skipped until a trial fetch succeeds"""
+    print('\nTesting circuit breaker...')
+
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+
+    time.sleep(0.06)
+    assert breaker.allow() == HALF_OPEN
+    assert not breaker.allow(), 'more than one trial fetch let through'
+    breaker.success()
+    assert breaker.state == CLOSED
+    print('✅ Circuit opened, half-opened and closed again')
+    return True
+
+
+def test_hedge_on_slow_first_byte():
+    """A fetch without data by the deadline is raced by the next one"""
+    print('\nTesting hedge on a slow first byte...')
+
+    fetcher = HedgedFetcher(Path(tempfile.mkdtemp()), default_deadline=0.1)
+    started = time.monotonic()
+    attempt = fetcher.fetch([YTM, YT], fake_download({YTM: 2}))
+    elapsed = time.monotonic() - started
+
+    assert attempt.url == YT, attempt.url
+    assert attempt.path.read_bytes() == b'audio'
+    assert fetcher.hedges == 1
+    assert elapsed < 1, f'waited {elapsed:.2f}s for the slow fetch'
+    time.sleep(0.05)
+    assert len(list(fetcher.directory.iterdir())) == 1, 'loser not removed'
+    attempt.cleanup()
+    print(f'✅ Hedge won after {elapsed:.2f}s')
+    return True
+
+
+def test_lost_race_releases_own_trial_only():
+    """A hedge win reopens the circuit of its own lost trial, no other"""
+    print('\nTesting release of trial fetches that lost the race...')
+
+    fetcher = HedgedFetcher(Path(tempfile.mkdtemp()), default_deadline=0.1)
+    breaker = fetcher.breaker('youtube-music')
+    breaker.state = OPEN
+    attempt = fetcher.fetch([YTM, YT], fake_download({YTM: 0.5}))
+    assert attempt.url == YT, attempt.url
+    assert breaker.state == OPEN, 'lost trial left the circuit half-open'
+    attempt.cleanup()
+
+    slow = fake_download({YTM: 0.5})
+
+    def download(url, directory, progress_hook):
+        if url == YT:
+            # Another track gets the trial while this one is hedging
+            breaker.state = HALF_OPEN
+        return slow(url, directory, progress_hook)
+
+    breaker.success()
+    attempt = fetcher.fetch([YTM, YT], download)
+    assert attempt.url == YT, attempt.url
+    assert breaker.state == HALF_OPEN, 'trial of another track was ended'
+    attempt.cleanup()
+    print('✅ Only the trial that lost the race gives up its circuit')
+    return True
+
+
+def test_failover_and_open_circuit():
+    """Failed fetches move on to the next candidate and trip the breaker"""
+    print('\nTesting failover and open circuits...')
+
+    fetcher = HedgedFetcher(Path(tempfile.mkdtemp()))
+    download = fake_download({}, failing={YTM, RUNNER_UP})
+    for _ in range(5):
+        attempt = fetcher.fetch([YTM, YT], download)
+        assert attempt.url == YT, attempt.url
+        attempt.cleanup()
+    assert fetcher.breakers['youtube-music'].state == OPEN
+
+    attempt = fetcher.fetch([RUNNER_UP, YT], download)
+    assert attempt.url == YT
+    assert fetcher.hedges == 5, 'open circuit was still tried'
+
+    message = None
+    try:
+        fetcher.fetch([RUNNER_UP], download)
+    except AudioProviderError as error:
+        message = str(error)
+    assert message == 'youtube-music circuit is open', message
+    print('✅ Failed over to YouTube and stopped calling YouTube Music')
+    return True
+
+
+def test_attempts_carry_context():
+    """Fetch threads log with the track and count towards its profile"""
+    print('\nTesting trace and profile context of fetch threads...')
+
+    records = []
+
+    def download(url, directory, progress_hook):
+        record = logging.LogRecord(
+            'downtify.app', logging.INFO, __file__, 1, 'fetching', (), None
+        )
+        tracing.ContextFilter().filter(record)
+        records.append(record)
+        deadline = time.monotonic() + 0.1
+        while time.monotonic() < deadline:
+            pass
+        return fake_download({})(url, directory, progress_hook)
+
+    profiler = Profiler(tempfile.mkdtemp(), interval=0.001)
+    profile = profiler.start('job')
+    fetcher = HedgedFetcher(Path(tempfile.mkdtemp()))
+    with (
+        attached(profile, 'worker'),
+        tracing.span('track', **{'job.id': 'job1', 'track.id': 'track1'}),
+    ):
+        fetcher.fetch([YTM], download).cleanup()
+    profiler.stop(profile)
+
+    assert getattr(records[0], 'job_id', None) == 'job1', vars(records[0])
+    assert records[0].track_id == 'track1'
+    labels = {label for label, _ in profile.samples}
+    assert 'fetch' in labels, labels
+    assert not profile.threads, 'fetch thread was not detached'
+    print(f'✅ Fetch thread logged for track1 and was sampled as {labels}')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🏁 Testing Hedged Fetching for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_candidates,
+        test_circuit_breaker,
+        test_hedge_on_slow_first_byte,
+        test_lost_race_releases_own_trial_only,
+        test_failover_and_open_circuit,
+        test_attempts_carry_context,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
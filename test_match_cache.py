@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the persistent Spotify to YouTube match cache
+"""
+
+import os
+import sys
+import tempfile
+from collections import namedtuple
+from types import SimpleNamespace
+
+from spotdl.providers.audio.base import AudioProvider
+from spotdl.types.result import Result
+from spotdl.types.song import Song
+
+from downtify import match_cache
+from downtify.match_cache import Match, MatchCache
+
+
+def test_cache_roundtrip():
+    """Matches survive a reopen of the cache file"""
+    print('Testing match cache roundtrip...')
+
+    path = os.path.join(tempfile.mkdtemp(), 'matches.sqlite3')
+    cache = MatchCache(path)
+    cache.put(
+        Match(
+            song_id='4uLU6hMCjMI75M1A2tKUQC',
+            provider='YouTubeMusic',
+            url='https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+            score=97.5,
+            candidates=[('https://music.youtube.com/watch?v=x', 80.0)],
+        )
+    )
+
+    match = MatchCache(path).get('4uLU6hMCjMI75M1A2tKUQC')
+    assert match is not None, 'match was not persisted'
+    assert match.video_id == 'dQw4w9WgXcQ', match.video_id
+    assert match.score == 97.5
+    assert match.candidates[0][0].endswith('v=x')
+    print(f'✅ Cached match found: {match.provider} {match.video_id}')
+    return True
+
+
+def test_cache_ttl_and_invalidate():
+    """Expired and invalidated entries are not returned"""
+    print('\nTesting expiry and invalidation...')
+
+    cache = MatchCache(':memory:', ttl=60)
+    cache.put(Match('old', 'YouTube', 'https://youtu.be/a', 90, [], 0))
+    cache.put(Match('new', 'YouTube', 'https://youtu.be/b', 90))
+    cache.put(Match('other', 'YouTube', 'https://youtu.be/c', 90))
+
+    assert cache.get('old') is None, 'expired match was returned'
+    assert cache.get('new').video_id == 'b'
+    assert cache.invalidate('new') == 1
+    assert cache.get('new') is None
+    assert cache.invalidate() == 1
+    assert len(cache) == 0
+    print('✅ Expired and invalidated matches are dropped')
+    return True
+
+
+def test_rank_results_stops_on_certain_match():
+    """Ranking keeps runner-ups and skips filters after a certain match"""
+    print('\nTesting result ranking...')
+
+    result = namedtuple('Result', 'url verified', defaults=[True])
+
+    searches = []
+    provider = SimpleNamespace(
+        name='YouTubeMusic',
+        search_query=None,
+        SUPPORTS_ISRC=True,
+        GET_RESULTS_OPTS=[{'filter': 'songs'}, {'filter': 'videos'}],
+        get_results=lambda term, **options: (
+            searches.append(term)
+            or [result('https://y/a'), result('https://y/b')]
+        ),
+    )
+    scores = {'https://y/a': 70.0, 'https://y/b': 91.0}
+
+    original = match_cache.order_results
+    match_cache.order_results = lambda results, *_: {
+        r: scores[r.url] for r in results
+    }
+    try:
+        song = SimpleNamespace(
+            name='Song', artists=['Artist'], isrc='USRC17607839'
+        )
+        ranked = match_cache.rank_results(provider, song)
+    finally:
+        match_cache.order_results = original
+
+    assert ranked == [('https://y/b', 91.0), ('https://y/a', 70.0)], ranked
+    assert searches == ['USRC17607839'], searches
+    print('✅ Results ranked best first, search stopped after ISRC match')
+    return True
+
+
+class FakeProvider(AudioProvider):
+    """An audio provider answering every search from a dict"""
+
+    SUPPORTS_ISRC = True
+    GET_RESULTS_OPTS = [{'filter': 'songs'}, {'filter': 'videos'}]
+
+    def __init__(self, searches, filter_results=True):
+        super().__init__(filter_results=filter_results)
+        self.searches = searches
+
+    def get_results(self, search_term, **options):
+        return self.searches.get((search_term, options.get('filter')), [])
+
+
+def result(video, name, verified=True, views=1000, **fields):
+    return Result(
+        source='YouTubeMusic',
+        url=f'https://music.youtube.com/watch?v={video}',
+        verified=verified,
+        name=name,
+        duration=fields.pop('duration', 213),
+        author='Rick Astley',
+        result_id=video,
+        artists=('Rick Astley',),
+        views=views,
+        album='Whenever You Need Somebody',
+        **fields,
+    )
+
+
+def test_find_match_agrees_with_spotdl():
+    """The ranked match is the one spotdl's own search returns"""
+    print('\nTesting ranking against AudioProvider.search...')
+
+    song = Song.from_missing_data(
+        name='Never Gonna Give You Up',
+        artists=['Rick Astley'],
+        artist='Rick Astley',
+        album_name='Whenever You Need Somebody',
+        duration=213,
+        year=1987,
+        song_id='4uLU6hMCjMI75M1A2tKUQC',
+        url='https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC',
+        isrc='GBARL9300135',
+    )
+    isrc = ('GBARL9300135', None)
+    query = ('rick astley - never gonna give you up', 'songs')
+    videos = ('rick astley - never gonna give you up', 'videos')
+    title = 'Never Gonna Give You Up'
+    live = result('live', f'{title} (Live)', duration=240)
+    scenarios = {
+        'single verified ISRC result': {isrc: [result('isrc', title)]},
+        'ISRC result found again by text': {
+            isrc: [live, result('other', 'Something Else', verified=False)],
+            query: [result('title', title, views=10), live],
+        },
+        'near tie broken by views': {
+            query: [
+                result('few', 'Never Gonna Give U Up', False, views=10),
+                result('many', f'{title} (2022 Remaster)', False, 10**6),
+            ],
+            videos: [result('video', f'{title} (Video)', verified=False)],
+        },
+        'only unverified results': {
+            isrc: [result('a', title, verified=False, duration=230)],
+            videos: [result('b', f'{title} Remix', verified=False)],
+        },
+        'no results': {},
+    }
+
+    for name, searches in scenarios.items():
+        for filter_results in (False, True):
+            provider = FakeProvider(searches, filter_results)
+            downloader = SimpleNamespace(
+                audio_providers=[provider],
+                settings={'only_verified_results': False},
+            )
+            expected = provider.search(song)
+            try:
+                url = match_cache.find_match(downloader, song).url
+            except LookupError:
+                url = None
+            assert url == expected, f'{name}: {url} instead of {expected}'
+        print(f'✅ {name}: {expected}')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🎯 Testing Match Cache for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_cache_roundtrip,
+        test_cache_ttl_and_invalidate,
+        test_rank_results_stops_on_certain_match,
+        test_find_match_agrees_with_spotdl,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
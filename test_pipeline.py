@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the per-track download pipeline
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+from spotdl.types.song import Song
+from spotdl.utils.config import DOWNLOADER_OPTIONS
+from spotdl.utils.ffmpeg import FFmpegError
+from spotdl.utils.metadata import MetadataError
+
+from downtify import pipeline
+from downtify.hedging import Attempt
+from downtify.match_cache import Match, MatchCache
+from downtify.pipeline import Pipeline
+from downtify.streaming import GrowingFile
+from downtify.tracing import start_span
+
+VIDEO = 'https://music.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+def make_song(**fields):
+    return Song.from_missing_data(
+        name='Never Gonna Give You Up',
+        artists=['Rick Astley'],
+        artist='Rick Astley',
+        album_id='6XhjNHCyCDyyGJRM5mg40G',
+        album_name='Whenever You Need Somebody',
+        album_artist='Rick Astley',
+        genres=['dance pop'],
+        disc_count=1,
+        tracks_count=10,
+        track_number=1,
+        duration=213,
+        song_id='4uLU6hMCjMI75M1A2tKUQC',
+        url='https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC',
+        **fields,
+    )
+
+
+class FakeDownloader:
+    """The settings and searches of spotdl's `Downloader`"""
+
+    def __init__(self, **settings):
+        self.settings = {
+            **DOWNLOADER_OPTIONS,
+            'output': str(
+                Path(tempfile.mkdtemp()) / '{artists} - {title}.{output-ext}'
+            ),
+            **settings,
+        }
+        self.ffmpeg = 'ffmpeg'
+        self.searches = []
+
+    def search(self, song):
+        self.searches.append(song.song_id)
+        return VIDEO
+
+    @staticmethod
+    def search_lyrics(song):
+        return 'Never gonna give you up'
+
+
+class FakeFetcher:
+    """Serves every fetch from a file written into its own directory"""
+
+    def __init__(self, ext='webm', info=None):
+        self.ext = ext
+        self.info = {'abr': 160.4} if info is None else info
+        self.attempts = []
+
+    def fetch(self, urls, download, parent=None):
+        directory = Path(tempfile.mkdtemp())
+        path = directory / f'dQw4w9WgXcQ.{self.ext}'
+        path.write_bytes(b'audio')
+        attempt = Attempt(
+            url=urls[0],
+            provider='youtube-music',
+            directory=directory,
+            span=start_span('fetch-attempt', parent),
+            path=path,
+            info={'id': 'dQw4w9WgXcQ', 'ext': self.ext, **self.info},
+        )
+        self.attempts.append(attempt)
+        return attempt
+
+
+class Fakes:
+    """Replaces ffmpeg and the tagger of the pipeline for the block"""
+
+    def __init__(self, converted=True, tag_error=None):
+        self.converted = converted
+        self.tag_error = tag_error
+        self.conversions = []
+        self.tagged = []
+
+    def convert(self, input_file, output_file, bitrate, **_):
+        self.conversions.append(bitrate)
+        if not self.converted:
+            Path(output_file).write_bytes(b'partial')
+            return False, {
+                'error': 'ffmpeg version 6.0\n'
+                'Input #0, matroska,webm\n'
+                f'{input_file}: Invalid data found when processing input\n'
+            }
+        Path(output_file).write_bytes(b'ID3' + Path(input_file).read_bytes())
+        return True, None
+
+    def embed_metadata(self, output_file, song, **_):
+        if self.tag_error:
+            raise self.tag_error
+        self.tagged.append((output_file, song.lyrics))
+
+    def __enter__(self):
+        self.originals = pipeline.convert, pipeline.embed_metadata
+        pipeline.convert = self.convert
+        pipeline.embed_metadata = self.embed_metadata
+        return self
+
+    def __exit__(self, *_):
+        pipeline.convert, pipeline.embed_metadata = self.originals
+
+
+def test_run_end_to_end():
+    """A song is matched, fetched, converted and tagged"""
+    print('Testing a download through the pipeline...')
+
+    downloader = FakeDownloader()
+    fetcher = FakeFetcher()
+    stream = GrowingFile()
+    with Fakes() as fakes:
+        path = Pipeline(downloader, fetcher=fetcher).run(make_song(), stream)
+
+    assert path.name == 'Rick Astley - Never Gonna Give You Up.mp3', path
+    assert path.read_bytes() == b'ID3audio'
+    assert downloader.searches == ['4uLU6hMCjMI75M1A2tKUQC']
+    assert fakes.conversions == ['160k'], fakes.conversions
+    assert fakes.tagged == [(path, 'Never gonna give you up')]
+    assert stream.finished
+    assert stream.path == path
+    assert not stream.error, stream.error
+    attempt = fetcher.attempts[0]
+    assert attempt.url == VIDEO, attempt.url
+    assert not attempt.directory.exists(), 'attempt was not cleaned up'
+    print(f'✅ Downloaded to {path.name}')
+    return True
+
+
+def test_existing_file_skipped():
+    """An existing file is kept unless overwriting is forced"""
+    print('\nTesting existing files...')
+
+    downloader = FakeDownloader()
+    song = make_song()
+    output_file = Pipeline(downloader, fetcher=FakeFetcher()).output_file(song)
+    output_file.write_bytes(b'old')
+
+    fetcher = FakeFetcher()
+    stream = GrowingFile()
+    with Fakes():
+        path = Pipeline(downloader, fetcher=fetcher).run(song, stream)
+    assert path == output_file
+    assert path.read_bytes() == b'old'
+    assert not fetcher.attempts, 'existing file was fetched again'
+    assert stream.finished
+    assert stream.path == path
+
+    downloader.settings['overwrite'] = 'force'
+    with Fakes():
+        Pipeline(downloader, fetcher=fetcher).run(song)
+    assert path.read_bytes() == b'ID3audio'
+    assert len(fetcher.attempts) == 1
+    print('✅ Skipped, then overwritten with overwrite=force')
+    return True
+
+
+def test_transcode_choices():
+    """Audio is moved when it can be, converted at the right bitrate if not"""
+    print('\nTesting move or convert...')
+
+    cases = [
+        # bitrate setting, fetched extension, info, expected conversion
+        ('auto', 'mp3', {'abr': 128}, None),
+        (None, 'mp3', {'abr': 128}, None),
+        ('disable', 'webm', {}, [None]),
+        ('auto', 'webm', {'abr': 0}, ['copy']),
+        ('auto', 'webm', {'abr': 129.9}, ['129k']),
+        ('192k', 'mp3', {'abr': 128}, ['192k']),
+    ]
+    for bitrate, ext, info, expected in cases:
+        directory = Path(tempfile.mkdtemp())
+        fetched = directory / f'audio.{ext}'
+        fetched.write_bytes(b'audio')
+        output_file = directory / 'song.mp3'
+        with Fakes() as fakes:
+            Pipeline(
+                FakeDownloader(bitrate=bitrate), fetcher=FakeFetcher()
+            ).transcode(fetched, output_file, info)
+
+        assert not fetched.exists(), f'{bitrate} {ext}: source kept'
+        assert output_file.exists()
+        if expected is None:
+            assert not fakes.conversions, f'{bitrate} {ext}: converted'
+            assert output_file.read_bytes() == b'audio', 'not moved'
+        else:
+            assert fakes.conversions == expected, (bitrate, fakes.conversions)
+        print(f'✅ bitrate={bitrate} .{ext}: {expected or "moved"}')
+    return True
+
+
+def test_ffmpeg_failure():
+    """A failed conversion reports ffmpeg's last line and cleans up"""
+    print('\nTesting a failed conversion...')
+
+    fetcher = FakeFetcher()
+    stream = GrowingFile()
+    runner = Pipeline(FakeDownloader(), fetcher=fetcher)
+    message = None
+    with Fakes(converted=False):
+        try:
+            runner.run(make_song(), stream)
+        except FFmpegError as error:
+            message = str(error)
+
+    assert message is not None, 'conversion error was not raised'
+    assert not runner.output_file(make_song()).exists(), 'output was kept'
+    assert message.endswith('Invalid data found when processing input')
+    assert message.startswith('Failed to convert converted.mp3: '), message
+    assert stream.finished
+    assert stream.error.startswith('FFmpegError: '), stream.error
+    assert not fetcher.attempts[0].directory.exists(), 'attempt was kept'
+    print(f'✅ {message}')
+    return True
+
+
+def test_metadata_failure():
+    """A tagging error is wrapped and still cleans up the attempt"""
+    print('\nTesting a failed tagging...')
+
+    fetcher = FakeFetcher()
+    stream = GrowingFile()
+    cause = ValueError('bad cover')
+    error = None
+    with Fakes(tag_error=cause):
+        try:
+            Pipeline(FakeDownloader(), fetcher=fetcher).run(
+                make_song(), stream
+            )
+        except MetadataError as raised:
+            error = raised
+
+    assert error is not None, 'tagging error was not raised'
+    assert error.__cause__ is cause
+    assert (
+        stream.error == 'MetadataError: Failed to embed metadata to the song'
+    )
+    assert not fetcher.attempts[0].directory.exists(), 'attempt was kept'
+    print(f'✅ {stream.error}')
+    return True
+
+
+class FakeSearch:
+    """Stands in for `find_match`, counting the searches made"""
+
+    def __init__(self):
+        self.songs = []
+
+    def __call__(self, downloader, song):
+        self.songs.append(song.song_id)
+        return Match(song.song_id, 'YouTubeMusic', VIDEO, 95.0)
+
+    def __enter__(self):
+        self.original = pipeline.find_match
+        pipeline.find_match = self
+        return self
+
+    def __exit__(self, *_):
+        pipeline.find_match = self.original
+
+
+def test_repeat_download_skips_search():
+    """The second match of a song comes from the cache, without a search"""
+    print('\nTesting matches through the match cache...')
+
+    runner = Pipeline(
+        FakeDownloader(), MatchCache(':memory:'), fetcher=FakeFetcher()
+    )
+    with FakeSearch() as search:
+        first = runner.match(make_song())
+        second = runner.match(make_song())
+
+    assert first[1] == 'search', first
+    assert second == (first[0], 'cache'), second
+    assert search.songs == ['4uLU6hMCjMI75M1A2tKUQC'], search.songs
+    assert second[0][0] == VIDEO
+    print(f'✅ Searched once, then matched from the cache: {second[0]}')
+    return True
+
+
+def test_failed_download_invalidates_match():
+    """A cached match is dropped when its download fails, unless given"""
+    print('\nTesting invalidation of failed matches...')
+
+    cache = MatchCache(':memory:')
+    runner = Pipeline(FakeDownloader(), cache, fetcher=FakeFetcher())
+    with FakeSearch(), Fakes(converted=False):
+        for song in (make_song(), make_song(download_url=VIDEO)):
+            cache.put(Match(song.song_id, 'YouTubeMusic', VIDEO, 95.0))
+            try:
+                runner.run(song)
+            except FFmpegError:
+                pass
+            else:
+                raise AssertionError('conversion error was not raised')
+            kept = cache.get(song.song_id) is not None
+            assert kept == bool(song.download_url), (song.download_url, kept)
+
+    print('✅ Searched matches dropped, given download URLs left alone')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🛠️ Testing the Download Pipeline for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_run_end_to_end,
+        test_existing_file_skipped,
+        test_transcode_choices,
+        test_ffmpeg_failure,
+        test_metadata_failure,
+        test_repeat_download_skips_search,
+        test_failed_download_invalidates_match,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the opt-in sampling profiler
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from downtify.profiling import Profiler, attached
+
+
+def busy_wait(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_profile_request_thread():
+    """The calling thread is sampled and written in both formats"""
+    print('Testing request profiling...')
+
+    profiler = Profiler(tempfile.mkdtemp(), interval=0.001)
+    with profiler.profile('download-test') as profile:
+        busy_wait(0.2)
+
+    assert profile.samples, 'no samples were taken'
+    files = [item['file'] for item in profiler.list()]
+    collapsed = next(f for f in files if f.endswith('.collapsed.txt'))
+    speedscope = next(f for f in files if f.endswith('.speedscope.json'))
+
+    with open(profiler.path(collapsed), encoding='utf-8') as file:
+        assert ':busy_wait' in file.read()
+    with open(profiler.path(speedscope), encoding='utf-8') as file:
+        data = json.load(file)
+    assert data['profiles'][0]['type'] == 'sampled'
+    assert data['profiles'][0]['name'] == 'download-test [request]'
+    print(f'✅ Captured {sum(profile.samples.values())} samples in {files}')
+    return True
+
+
+def test_worker_threads_are_attached():
+    """Worker threads only contribute while attached to the profile"""
+    print('\nTesting worker thread attachment...')
+
+    profiler = Profiler(tempfile.mkdtemp(), interval=0.001)
+    profile = profiler.start('job')
+
+    def worker():
+        with attached(profile, 'worker'):
+            busy_wait(0.1)
+        busy_wait(0.1)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    profiler.stop(profile)
+
+    labels = {label for label, _ in profile.samples}
+    assert labels == {'worker'}, labels
+    assert not profile.threads, 'worker was not detached'
+    print('✅ Only attached worker time was sampled')
+    return True
+
+
+def test_profiles_are_pruned():
+    """Old profiles are removed and paths cannot escape the directory"""
+    print('\nTesting profile retention...')
+
+    directory = tempfile.mkdtemp()
+    profiler = Profiler(directory, interval=0.001, keep=1)
+    for name in ('first', 'second'):
+        profiler.stop(profiler.start(name))
+
+    assert len(os.listdir(directory)) == 2, os.listdir(directory)
+    assert profiler.path('../etc/passwd') is None
+    print('✅ Only the newest profile is kept')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🔬 Testing Profiler for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_profile_request_thread,
+        test_worker_threads_are_attached,
+        test_profiles_are_pruned,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
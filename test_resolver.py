@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Test script to verify paged resolution and streamed submission of playlists
+"""
+
+import sys
+import threading
+import time
+
+from downtify.resolver import BoundedCache, iter_playlist, song_from_item
+from downtify.scheduler import DONE, TrackScheduler
+
+PLAYLIST = 'https://open.spotify.com/playlist/37i9dQZF1DXcBWIGoYBM5M'
+
+
+def make_item(index, **track):
+    return {
+        'track': {
+            'id': f'id{index}',
+            'name': f'Song {index}',
+            'type': 'track',
+            'is_local': False,
+            'duration_ms': 180000,
+            'explicit': False,
+            'disc_number': 1,
+            'track_number': 1,
+            'external_urls': {
+                'spotify': f'https://open.spotify.com/track/id{index}'
+            },
+            'external_ids': {'isrc': f'ISRC{index}'},
+            'artists': [{'name': 'Artist'}],
+            'album': {
+                'id': 'album',
+                'name': 'Album',
+                'album_type': 'album',
+                'release_date': '2020-01-01',
+                'total_tracks': 10,
+                'images': [{'url': 'small', 'width': 64, 'height': 64}],
+                'artists': [{'name': 'Artist'}],
+            },
+            **track,
+        }
+    }
+
+
+class FakeSpotify:
+    """Serves a playlist of `total` tracks in pages, counting requests"""
+
+    def __init__(self, total):
+        self.total = total
+        self.requests = 0
+
+    @staticmethod
+    def _get_id(kind, url):
+        return url.rsplit('/', 1)[-1]
+
+    @staticmethod
+    def playlist(url, fields=None):
+        return {'name': 'Big', 'owner': {'display_name': 'me'}, 'images': []}
+
+    def _internal_call(self, method, url, payload, params):
+        self.requests += 1
+        if url.startswith('next:'):
+            offset, limit = map(int, url[5:].split(','))
+        else:
+            offset, limit = params['offset'], params['limit']
+        end = min(offset + limit, self.total)
+        return {
+            'items': [make_item(i) for i in range(offset, end)],
+            'total': self.total,
+            'next': f'next:{end},{limit}' if end < self.total else None,
+        }
+
+
+def test_skipped_items():
+    """Local files, episodes and unavailable tracks are skipped"""
+    print('Testing playlist item conversion...')
+
+    song = song_from_item(make_item(1), list_position=3)
+    assert song.name == 'Song 1'
+    assert song.year == '2020'
+    assert song.cover_url == 'small'
+    assert song.list_position == 3
+
+    assert song_from_item(None) is None
+    assert song_from_item({'track': None}) is None
+    assert song_from_item(make_item(2, is_local=True)) is None
+    assert song_from_item(make_item(3, type='episode')) is None
+    assert song_from_item(make_item(4, id=None)) is None
+    assert song_from_item(make_item(5, duration_ms=0)) is None
+    print('✅ Items converted like spotdl does')
+    return True
+
+
+def test_pages_fetched_lazily():
+    """Pages are only requested as the songs are consumed"""
+    print('\nTesting lazy paging...')
+
+    client = FakeSpotify(1000)
+    songs = iter_playlist(PLAYLIST, client, page_size=100)
+    first = [next(songs) for _ in range(150)]
+    assert client.requests == 2, f'{client.requests} pages requested'
+    assert first[-1].list_position == 150
+    assert first[-1].list_length == 1000
+
+    rest = list(songs)
+    assert len(first) + len(rest) == 1000
+    assert client.requests == 10
+    print('✅ 2 pages read for the first 150 songs, 10 for all of them')
+    return True
+
+
+def test_submit_stream_window():
+    """A streamed job never has more than `window` tracks waiting"""
+    print('\nTesting streamed submission with a window...')
+
+    gate = threading.Event()
+    scheduler = TrackScheduler(lambda track: gate.wait(5) and '/tmp/x', 2)
+    produced = []
+
+    def songs():
+        for index in range(100):
+            produced.append(index)
+            yield f's{index}'
+
+    job = scheduler.submit_stream('ip:1', songs(), window=5)
+    time.sleep(0.2)
+    assert scheduler.queued == 5, scheduler.queued
+    # 5 waiting, 2 running and one pulled, waiting for room in the window
+    assert len(produced) <= 8, f'{len(produced)} songs pulled'
+    assert not job.wait(0)
+
+    gate.set()
+    assert job.wait(5), 'streamed job did not finish'
+    assert len(job.tracks) == 100
+    assert all(track.status == DONE for track in job.tracks)
+    assert job.tracks[0].song is None, 'finished track kept its song'
+    assert job.tracks[0].as_dict()['name'] == 's0'
+    print(f'✅ Pulled {len(produced)} songs while the first were running')
+    return True
+
+
+def test_submit_stream_errors():
+    """An error while resolving ends the feed and is kept on the job"""
+    print('\nTesting resolution errors...')
+
+    scheduler = TrackScheduler(lambda track: '/tmp/x', 2)
+
+    def songs():
+        yield 'one'
+        raise ValueError('Invalid playlist URL')
+
+    job = scheduler.submit_stream('ip:1', songs())
+    assert job.wait(5)
+    assert job.error == 'ValueError: Invalid playlist URL', job.error
+    assert len(job.tracks) == 1
+
+    empty = scheduler.submit_stream('ip:1', iter([]))
+    assert empty.wait(5), 'empty streamed job did not finish'
+    assert not empty.tracks
+    print('✅ Errors recorded and empty playlists finish')
+    return True
+
+
+def test_bounded_cache():
+    """Only the responses set last are kept"""
+    print('\nTesting the bounded Spotify response cache...')
+
+    cache = BoundedCache(3)
+    for index in range(10):
+        cache[f'albums/{index}'] = {'id': index}
+    cache['albums/7'] = {'id': 7}
+    cache['albums/10'] = {'id': 10}
+
+    assert list(cache) == ['albums/9', 'albums/7', 'albums/10'], list(cache)
+    assert cache.get('albums/0') is None
+    print(f'✅ Kept {list(cache)}')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('📜 Testing Playlist Resolution for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_skipped_items,
+        test_pages_fetched_lazily,
+        test_submit_stream_window,
+        test_submit_stream_errors,
+        test_bounded_cache,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test script to verify fair scheduling of tracks across users
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from downtify.scheduler import DONE, FAILED, TrackScheduler
+
+
+def make_scheduler(workers=2, per_owner_limit=None):
+    order = []
+    gate = threading.Event()
+
+    def process(track):
+        gate.wait(5)
+        order.append((track.job.owner, track.song))
+        return f'/tmp/{track.song}.mp3'
+
+    scheduler = TrackScheduler(
+        process, workers=workers, per_owner_limit=per_owner_limit
+    )
+    return scheduler, order, gate
+
+
+def test_single_track_not_starved():
+    """A single track submitted after a large playlist runs early"""
+    print('Testing single track is not starved by a playlist...')
+
+    scheduler, order, gate = make_scheduler(workers=1)
+    playlist = scheduler.submit('ip:1', [f'p{i}' for i in range(50)])
+    single = scheduler.submit('ip:2', ['single'])
+    gate.set()
+
+    assert single.wait(5), 'single-track job did not finish'
+    assert playlist.wait(5), 'playlist job did not finish'
+    position = order.index(('ip:2', 'single'))
+    assert position <= 2, f'single track ran at position {position}'
+    print(f'✅ Single track ran at position {position} of {len(order)}')
+    return True
+
+
+def test_per_owner_limit():
+    """One submitter cannot hold every worker"""
+    print('\nTesting per-user concurrency cap...')
+
+    scheduler, _, gate = make_scheduler(workers=4)
+    job = scheduler.submit('ip:1', [f'p{i}' for i in range(10)])
+    time.sleep(0.2)
+    assert scheduler.per_owner_limit == 3
+    assert scheduler.running == 3, f'{scheduler.running} workers busy'
+    gate.set()
+    assert job.wait(5)
+    print('✅ Per-user cap leaves a worker free for other users')
+    return True
+
+
+def test_shortest_job_first():
+    """Within one submitter, the shorter job goes first"""
+    print('\nTesting shortest job first within a submitter...')
+
+    scheduler, order, gate = make_scheduler(workers=1)
+    blocker = scheduler.submit('ip:1', ['blocker'])
+    big = scheduler.submit('ip:1', [f'b{i}' for i in range(5)])
+    small = scheduler.submit('ip:1', ['s0'])
+    gate.set()
+
+    for job in (blocker, big, small):
+        assert job.wait(5)
+    assert order.index(('ip:1', 's0')) < order.index(('ip:1', 'b1'))
+    print('✅ Short job overtakes the longer one')
+    return True
+
+
+def test_weighted_share():
+    """A submitter of weight 2 gets twice the share of the others"""
+    print('\nTesting weighted submitters...')
+
+    scheduler, order, gate = make_scheduler(workers=1)
+    heavy = [
+        scheduler.submit('key:a', [f'a{job}{i}' for i in range(10)], weight=2)
+        for job in range(2)
+    ]
+    light = scheduler.submit('ip:2', [f'l{i}' for i in range(10)])
+    gate.set()
+
+    for job in (*heavy, light):
+        assert job.wait(5)
+    share = [owner for owner, _ in order[:15]].count('key:a')
+    assert 9 <= share <= 11, f'weighted submitter ran {share} of 15'
+    print(f'✅ Weighted submitter ran {share} of the first 15 tracks')
+    return True
+
+
+def test_job_status():
+    """Job status reflects failed and successful tracks"""
+    print('\nTesting job status...')
+
+    def process(track):
+        if track.song == 'bad':
+            raise RuntimeError('AudioProviderError: YT-DLP download error')
+        return f'/tmp/{track.song}.mp3'
+
+    scheduler = TrackScheduler(process, workers=2)
+    ok = scheduler.submit('ip:1', ['good'])
+    bad = scheduler.submit('ip:1', ['bad'])
+    empty = scheduler.submit('ip:1', [])
+
+    for job in (ok, bad, empty):
+        assert job.wait(5)
+    assert ok.status == DONE
+    assert bad.status == FAILED
+    assert 'YT-DLP' in bad.tracks[0].error
+    assert scheduler.get(ok.id) is ok
+    print('✅ Job status and errors are tracked per track')
+    return True
+
+
+def test_submitter_cannot_be_spoofed():
+    """Unknown API keys and forwarded addresses do not make a new user"""
+    print('\nTesting submitter identity...')
+
+    os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp())
+    os.environ.setdefault('STATE_DIR', tempfile.mkdtemp())
+    from starlette.requests import Request
+
+    import main
+
+    def submitter(**headers):
+        return main.get_submitter(
+            Request({
+                'type': 'http',
+                'client': ('10.0.0.9', 5000),
+                'headers': [
+                    (name.replace('_', '-').encode(), value.encode())
+                    for name, value in headers.items()
+                ],
+            })
+        )
+
+    keys, trust = main.API_KEYS, main.TRUST_PROXY
+    main.API_KEYS = main.parse_api_keys('secret:2, other')
+    try:
+        main.TRUST_PROXY = False
+        assert submitter(x_api_key='secret') == ('key:secret', 2.0)
+        assert submitter(x_api_key='other') == ('key:other', 1.0)
+        assert submitter(x_api_key='made-up') == ('ip:10.0.0.9', 1.0)
+        assert submitter(x_forwarded_for='1.2.3.4') == ('ip:10.0.0.9', 1.0)
+
+        main.TRUST_PROXY = True
+        forwarded = submitter(x_forwarded_for='1.2.3.4, 203.0.113.7')
+        assert forwarded == ('ip:203.0.113.7', 1.0), forwarded
+    finally:
+        main.API_KEYS, main.TRUST_PROXY = keys, trust
+    print('✅ Only configured keys, weighted, and the proxy hop are trusted')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🗓️  Testing Track Scheduler for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_single_track_not_starved,
+        test_per_owner_limit,
+        test_shortest_job_first,
+        test_weighted_share,
+        test_job_status,
+        test_submitter_cannot_be_spoofed,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test script to verify streaming of tracks while they are being converted
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from downtify.streaming import GrowingFile
+
+
+def write_slowly(stream, directory, chunks=5, delay=0.05):
+    """Write a partial file in chunks, then publish the finished copy"""
+    partial = Path(directory) / 'converted.mp3'
+    final = Path(directory) / 'final.mp3'
+    with open(partial, 'wb') as file:
+        stream.start(partial)
+        for index in range(chunks):
+            file.write(bytes([index]) * 1000)
+            file.flush()
+            time.sleep(delay)
+    final.write_bytes(b'ID3' + partial.read_bytes())
+    stream.finish(final)
+    partial.unlink()
+    return final
+
+
+def test_follow_growing_file():
+    """A reader gets every byte written, then the stream ends"""
+    print('Testing following a growing file...')
+
+    stream = GrowingFile()
+    directory = tempfile.mkdtemp()
+    writer = threading.Thread(target=write_slowly, args=(stream, directory))
+    writer.start()
+
+    started = time.monotonic()
+    chunks = []
+    for chunk in stream.follow(poll=0.01):
+        chunks.append((time.monotonic() - started, chunk))
+    writer.join()
+
+    data = b''.join(chunk for _, chunk in chunks)
+    assert data == b''.join(bytes([i]) * 1000 for i in range(5)), len(data)
+    assert chunks[0][0] < 0.2, f'first byte after {chunks[0][0]:.2f}s'
+    assert len(chunks) > 1, 'file was only read once it was complete'
+    print(f'✅ {len(data)} bytes in {len(chunks)} chunks')
+    return True
+
+
+def test_start_before_file_exists():
+    """A reader waiting on `start()` follows a file created later"""
+    print('\nTesting a stream started before the file exists...')
+
+    stream = GrowingFile()
+    directory = tempfile.mkdtemp()
+
+    def probe_then_write():
+        # ffmpeg only creates its output once it has probed the input
+        stream.start(Path(directory) / 'converted.mp3')
+        time.sleep(0.3)
+        write_slowly(stream, directory, delay=0.1)
+
+    writer = threading.Thread(target=probe_then_write)
+    started = time.monotonic()
+    writer.start()
+    chunks = []
+    for chunk in stream.follow(poll=0.01):
+        chunks.append((time.monotonic() - started, chunk))
+    writer.join()
+
+    total = time.monotonic() - started
+    assert chunks[0][0] < total - 0.2, (
+        f'first byte at {chunks[0][0]:.2f}s of {total:.2f}s'
+    )
+    assert b''.join(chunk for _, chunk in chunks) == b''.join(
+        bytes([i]) * 1000 for i in range(5)
+    )
+    print(f'✅ First byte after {chunks[0][0]:.2f}s of {total:.2f}s')
+    return True
+
+
+def test_late_reader_gets_finished_file():
+    """A reader arriving after the track is done reads the tagged file"""
+    print('\nTesting a late reader...')
+
+    stream = GrowingFile()
+    write_slowly(stream, tempfile.mkdtemp(), delay=0)
+
+    data = b''.join(stream.follow())
+    assert data.startswith(b'ID3'), data[:10]
+    print('✅ Late reader got the finished file')
+    return True
+
+
+def test_failed_track():
+    """A track that fails before converting ends the stream empty"""
+    print('\nTesting a failed track...')
+
+    stream = GrowingFile()
+    stream.finish(error='AudioProviderError: YT-DLP download error')
+    assert list(stream.follow()) == []
+    assert stream.error.startswith('AudioProviderError')
+    print('✅ Failed track streams nothing')
+    return True
+
+
+def test_stream_endpoint():
+    """`/stream` serves a track of a running job as it is converted"""
+    print('\nTesting the /stream endpoint...')
+
+    os.environ.setdefault('DOWNLOAD_DIR', tempfile.mkdtemp())
+    os.environ.setdefault('STATE_DIR', tempfile.mkdtemp())
+    from fastapi.testclient import TestClient
+
+    import main
+    from downtify.scheduler import TrackScheduler
+
+    directory = tempfile.mkdtemp()
+
+    def process(track):
+        # What `main.download_track` does around the pipeline
+        try:
+            return str(write_slowly(main.stream_for(track), directory))
+        finally:
+            main.release_stream(track)
+
+    scheduler = TrackScheduler(process)
+    main.app.dependency_overrides[main.get_scheduler] = lambda: scheduler
+    try:
+        client = TestClient(main.app)
+        job = scheduler.submit('ip:1', ['song'])
+        track = job.tracks[0]
+        assert track.as_dict()['stream'] == f'/stream/{job.id}/{track.id}'
+
+        response = client.get(f'/stream/{job.id}/{track.id}')
+        assert response.status_code == 200, response.text
+        assert response.headers['content-type'] == 'audio/mpeg'
+        assert len(response.content) == 5000, len(response.content)
+
+        assert job.wait(5)
+        assert not job.context['streams'], 'finished track kept its stream'
+        response = client.get(f'/stream/{job.id}/{track.id}')
+        assert response.content.startswith(b'ID3'), 'finished file not used'
+        assert client.get(f'/stream/{job.id}/nope').status_code == 404
+        assert not job.context['streams'], 'stream created for a done track'
+    finally:
+        main.app.dependency_overrides.clear()
+    print('✅ Track streamed while converting and served once finished')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🎧 Testing Streaming for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_follow_growing_file,
+        test_start_before_file_exists,
+        test_late_reader_gets_finished_file,
+        test_failed_track,
+        test_stream_endpoint,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
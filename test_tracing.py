@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script to verify trace spans, the OTLP span file and the critical path
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from downtify import tracing
+from downtify.tracing import critical_path, read_spans, span, to_otlp
+
+
+def test_span_nesting():
+    """Child spans join the parent trace and inherit job and track IDs"""
+    print('Testing span nesting...')
+
+    with span('track', **{'job.id': 'job1', 'track.id': 'trk1'}) as root:
+        with span('fetch', url='https://y/a') as child:
+            assert tracing.current_span() is child
+        assert tracing.current_span() is root
+
+    assert tracing.current_span() is None
+    assert child.trace_id == root.trace_id
+    assert child.parent_id == root.span_id
+    assert child.attributes == {
+        'job.id': 'job1',
+        'track.id': 'trk1',
+        'url': 'https://y/a',
+    }, child.attributes
+    assert child.end_ns <= root.end_ns
+    print(f'✅ Child span {child.span_id} nested in {root.span_id}')
+    return True
+
+
+def test_span_error_status():
+    """A span that raises is ended with an error status"""
+    print('\nTesting failed spans...')
+
+    try:
+        with span('transcode') as failed:
+            raise ValueError('bad codec')
+    except ValueError:
+        pass
+
+    assert failed.status == tracing.STATUS_ERROR
+    assert failed.error == 'ValueError: bad codec', failed.error
+    otlp = to_otlp([failed])['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert otlp[0]['status'] == {'code': 2, 'message': 'ValueError: bad codec'}
+    print('✅ Failed span exported with status code 2')
+    return True
+
+
+def test_span_file_and_critical_path():
+    """Spans logged through the queue end up in the OTLP file"""
+    print('\nTesting OTLP span file and critical path...')
+
+    path = os.path.join(tempfile.mkdtemp(), 'spans.jsonl')
+    # Importing main may have configured logging already
+    tracing.shutdown_logging()
+    tracing.setup_logging('WARNING', trace_file=path)
+    try:
+        with span('download', **{'job.id': 'job2'}) as root:
+            for name in ('track-a', 'track-b'):
+                with span('track', song=name):
+                    with span('fetch'):
+                        pass
+                    with span('tag'):
+                        pass
+            logging.getLogger('downtify.app').warning('still running')
+    finally:
+        tracing.shutdown_logging()
+
+    spans = read_spans(path)
+    assert len(spans) == 1 + 2 * 3, len(spans)
+    assert all(s['traceId'] == root.trace_id for s in spans)
+    top = next(s for s in spans if s['spanId'] == root.span_id)
+    names = [s['name'] for s in critical_path(spans, top)]
+    assert names == ['download', 'track', 'tag'], names
+    last_track = critical_path(spans, top)[1]
+    assert {'key': 'song', 'value': {'stringValue': 'track-b'}} in (
+        last_track['attributes']
+    )
+    print(f'✅ Critical path: {" > ".join(names)}')
+    return True
+
+
+def test_json_formatter():
+    """Log lines carry the trace and job of the current span"""
+    print('\nTesting JSON log lines...')
+
+    record = logging.LogRecord(
+        'downtify.app', logging.INFO, __file__, 1, 'hello %s', ('x',), None
+    )
+    with span('search', **{'job.id': 'job3'}) as current:
+        tracing.ContextFilter().filter(record)
+
+    line = json.loads(tracing.JSONFormatter().format(record))
+    assert line['message'] == 'hello x'
+    assert line['trace_id'] == current.trace_id
+    assert line['job_id'] == 'job3'
+    print(f'✅ Log line: {line}')
+    return True
+
+
+def main():
+    """Run all tests"""
+    print('🧭 Testing Tracing for Downtify')
+    print('=' * 60)
+
+    tests = [
+        test_span_nesting,
+        test_span_error_status,
+        test_span_file_and_critical_path,
+        test_json_formatter,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as error:
+            print(f'❌ {test.__name__}: {error}')
+        print()
+
+    print('=' * 60)
+    print(f'Results: {passed}/{len(tests)} tests passed')
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())